@@ -0,0 +1,8 @@
+from pathlib import Path
+
+# Local development reads settings from .env before any module reads its configuration.
+# Deployments set the environment directly and never import dotenv.
+DOTENV_PATH = Path(__file__).parent.parent / ".env"
+if DOTENV_PATH.exists():
+    from dotenv import load_dotenv
+    load_dotenv(DOTENV_PATH)
@@ -0,0 +1,280 @@
+import os
+import threading
+from array import array
+from datetime import timedelta
+from itertools import accumulate
+
+from fastapi import HTTPException
+
+from schemas import race_classes
+
+from .cache import TTLCache
+
+from .database import mongodb_api_find
+
+from .export import export_filter
+
+from .metrics import register_cache, span
+
+from .responses import render_model
+
+from .shared_cache import CACHE_BACKEND, cache_backend
+
+# Driver and constructor season aggregates, kept as one array per metric and round.
+# Ingestion updates the affected season in place and re-renders only the drivers and constructors in it,
+# so /api/drivers/{code} and /api/constructors/{name} are a dictionary lookup however many seasons are stored.
+# Every stored race is read once per process, after that workers only fetch the races stored by other workers:
+#   shared cache backend - ingestion and backfill log the rounds they stored, the others fetch those rounds
+#   local - the newest stored round is compared, races after the newest one built in are fetched
+
+# races counts rounds entered, starts counts cars, so constructors average over both of their drivers
+METRICS = ("points", "positionChange", "fastestLaps", "dnfs", "races", "starts")
+# Half points were awarded in some races, every other metric is a count
+TYPECODES = {"points": "d", "positionChange": "l", "fastestLaps": "l", "dnfs": "l", "races": "l", "starts": "l"}
+# Seconds between checks for races stored by other workers
+AGGREGATES_CHECK_INTERVAL = timedelta(seconds=int(os.environ.get("AGGREGATES_CHECK_INTERVAL", 60)))
+AGGREGATES_CHANNEL = "simplef1:events:aggregates"
+# Atlas Data API upper bound for a single find
+MAX_FIND_LIMIT = 50000
+
+
+def constructor_key(name):
+    # Matches both the display name and the logo form, e.g. "Red Bull" and "RedBull"
+    return name.replace(" ", "").lower()
+
+
+class SeasonTable:
+    # Per-round columns for one season, rounds an entry did not take part in stay zero
+
+    def __init__(self, season):
+        self.season = season
+        self.rounds = 0
+        self.names = {}
+        self.columns = {}
+        self.summaries = {}
+
+    def _row(self, key):
+        row = self.columns.get(key)
+        if row is None:
+            row = self.columns[key] = {metric: array(TYPECODES[metric], [0]) * self.rounds for metric in METRICS}
+        return row
+
+    def set_round(self, round, entries):
+        # entries: key -> (name, {metric: value}), replaces whatever was stored for the round
+        if round > self.rounds:
+            for row in self.columns.values():
+                for column in row.values():
+                    column.extend([0] * (round - self.rounds))
+            self.rounds = round
+        changed = set(entries)
+        for key, row in self.columns.items():
+            if row["races"][round - 1] != 0 and key not in entries:
+                changed.add(key)
+            for column in row.values():
+                column[round - 1] = 0
+        for key, (name, values) in entries.items():
+            self.names[key] = name
+            row = self._row(key)
+            for metric, value in values.items():
+                row[metric][round - 1] = value
+        for key in changed:
+            self.summaries[key] = self._summarise(key)
+        return changed
+
+    def _summarise(self, key):
+        row = self.columns[key]
+        races = sum(row["races"])
+        return race_classes.SeasonAggregate(
+            season = self.season,
+            races = races,
+            points = sum(row["points"]),
+            pointsProgression = list(accumulate(row["points"])),
+            averagePositionChange = round(sum(row["positionChange"]) / sum(row["starts"]), 2) if races else 0.0,
+            fastestLaps = sum(row["fastestLaps"]),
+            dnfs = sum(row["dnfs"])
+        )
+
+
+class AggregateStore:
+    # Drivers are keyed by full name, codes fall back to the first letters of the family name in older seasons
+    # and are shared by different drivers, e.g. Graham, Phil and Damon Hill are all "HIL"
+
+    def __init__(self, seq=0):
+        self.driver_seasons = {}
+        self.constructor_seasons = {}
+        self.driver_payloads = {}
+        self.constructor_payloads = {}
+        # name -> (season, round, code) of the driver's latest race
+        self.driver_codes = {}
+        # code -> names of the drivers who raced with it
+        self.code_drivers = {}
+        # Last logged change applied and newest round added, read when catching up with other workers
+        self.seq = seq
+        self.newest = None
+        self._lock = threading.Lock()
+
+    def add_races(self, races):
+        # Races are RaceData dicts, stored or about to be
+        changed_drivers = set()
+        changed_constructors = set()
+        with self._lock:
+            for race in races:
+                season, round = race["race"]["season"], race["race"]["round"]
+                drivers = {}
+                constructors = {}
+                for entry in race["results"]:
+                    values = {
+                        "points": entry["points"],
+                        "positionChange": entry["positionChange"],
+                        "fastestLaps": 1 if entry["fastestLapRank"] == 1 else 0,
+                        "dnfs": 1 if entry["time"] == "DNF" else 0,
+                        "races": 1,
+                        "starts": 1
+                    }
+                    drivers[entry["name"]] = (entry["name"], values)
+                    latest = self.driver_codes.get(entry["name"])
+                    if latest is None or latest[:2] <= (season, round):
+                        self.driver_codes[entry["name"]] = (season, round, entry["driverCode"])
+                    self.code_drivers.setdefault(entry["driverCode"], set()).add(entry["name"])
+                    team = constructors.setdefault(constructor_key(entry["team"]), (entry["team"], dict.fromkeys(METRICS, 0)))[1]
+                    for metric, value in values.items():
+                        team[metric] += value
+                for _, team in constructors.values():
+                    team["races"] = 1
+                drivers_table = self.driver_seasons.setdefault(season, SeasonTable(season))
+                constructors_table = self.constructor_seasons.setdefault(season, SeasonTable(season))
+                changed_drivers.update(drivers_table.set_round(round, drivers))
+                changed_constructors.update(constructors_table.set_round(round, constructors))
+                if self.newest is None or self.newest < (season, round):
+                    self.newest = (season, round)
+            for key in changed_drivers:
+                self.driver_payloads[key] = render_model(race_classes.DriverAggregate(
+                    driverCode = self.driver_codes[key][2], name = key, seasons = self._seasons(self.driver_seasons, key)))
+            for key in changed_constructors:
+                self.constructor_payloads[key] = render_model(race_classes.ConstructorAggregate(
+                    name = self._latest_name(self.constructor_seasons, key), seasons = self._seasons(self.constructor_seasons, key)))
+
+    def find_driver(self, code):
+        # The driver who raced with the code most recently
+        names = self.code_drivers.get(code)
+        if not names:
+            return None
+        return self.driver_payloads[max(names, key=lambda name: self.driver_codes[name][:2])]
+
+    def _seasons(self, tables, key):
+        return [tables[season].summaries[key] for season in sorted(tables) if key in tables[season].summaries]
+
+    def _latest_name(self, tables, key):
+        for season in sorted(tables, reverse=True):
+            if key in tables[season].names:
+                return tables[season].names[key]
+        return key
+
+
+# The entry expiring only schedules a check, the store is built once and brought up to date in place
+aggregates_cache = TTLCache(ttl=AGGREGATES_CHECK_INTERVAL)
+register_cache("aggregates", aggregates_cache)
+# Change log shared with the other workers, None when each worker keeps its own caches
+_backend = cache_backend() if CACHE_BACKEND != "local" else None
+
+def find_races(races_filter):
+    races_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": races_filter,
+        "sort": {
+            "race.season": 1,
+            "race.round": 1
+        },
+        "limit": MAX_FIND_LIMIT,
+        "projection": {
+            "race.season": 1,
+            "race.round": 1,
+            "results": 1
+        }
+    }
+    return mongodb_api_find(races_find_payload)
+
+def newest_stored():
+    races_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {},
+        "sort": {
+            "race.season": -1,
+            "race.round": -1
+        },
+        "limit": 1,
+        "projection": {
+            "race.season": 1,
+            "race.round": 1
+        }
+    }
+    races = mongodb_api_find(races_find_payload)
+    return (races[0]["race"]["season"], races[0]["race"]["round"]) if races else None
+
+def logged_races(store):
+    # Races other workers logged since the store caught up, None when the log no longer reaches back that far
+    events = _backend.events(AGGREGATES_CHANNEL, store.seq)
+    if events is None:
+        return None
+    rounds = {tuple(int(part) for part in key.split(":")) for _, message in events for key in message.split(",")}
+    races = find_races({"$or": [{"race.season": season, "race.round": round} for season, round in sorted(rounds)]}) if rounds else []
+    if events:
+        store.seq = events[-1][0]
+    return races
+
+def newer_races(store):
+    newest = newest_stored()
+    if newest is None or (store.newest is not None and newest <= store.newest):
+        return []
+    return find_races(export_filter(None, None, store.newest))
+
+@span("aggregates_load")
+def build_aggregates():
+    # Changes logged from here on are fetched by the next check, a race stored during the find is not missed
+    store = AggregateStore(_backend.last_event(AGGREGATES_CHANNEL) if _backend is not None else 0)
+    store.add_races(find_races({}))
+    return store
+
+def load_aggregates():
+    store = aggregates_cache.peek("store")
+    if store is None:
+        return build_aggregates()
+    races = logged_races(store) if _backend is not None else newer_races(store)
+    if races is None:
+        return build_aggregates()
+    if races:
+        with span("aggregates_update"):
+            store.add_races(races)
+    return store
+
+def get_aggregates():
+    return aggregates_cache.get("store", load_aggregates)
+
+def add_races(races):
+    # Incremental update after ingestion, a process that has not built the store yet reads the races when it does
+    seq = None
+    if _backend is not None and races:
+        seq = _backend.publish(AGGREGATES_CHANNEL, ",".join(str(race["race"]["season"]) + ":" + str(race["race"]["round"]) for race in races))
+    store = aggregates_cache.peek("store")
+    if store is not None:
+        with span("aggregates_update"):
+            store.add_races(races)
+            if seq is not None and store.seq == seq - 1:
+                # Own change, nothing to fetch for it
+                store.seq = seq
+
+def get_driver_aggregate(code):
+    payload = get_aggregates().find_driver(code.upper())
+    if payload is None:
+        raise HTTPException(status_code=403, detail="driver resource not found")
+    return payload
+
+def get_constructor_aggregate(name):
+    payload = get_aggregates().constructor_payloads.get(constructor_key(name))
+    if payload is None:
+        raise HTTPException(status_code=403, detail="constructor resource not found")
+    return payload
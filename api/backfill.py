@@ -0,0 +1,170 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+from schemas import race_classes
+
+from .utils import async_call_data_source, data_source_client
+
+from .sources import ERGAST_API_URI, OPEN_METEO_ARCHIVE_API_URI
+
+from .database import async_mongodb_api_find, async_mongodb_api_insert_many, mongodb_client
+
+from . import aggregates, race_data
+
+from .tracks import find_track
+
+from .weather import async_get_forecasts, split_locations, weather_url, weekend_key
+
+ERGAST_PAGE_SIZE = 1000
+BACKFILL_CHUNK_SIZE = int(os.environ.get("BACKFILL_CHUNK_SIZE", 10))
+# Open-Meteo's archive trails real time by several days, more recent weekends are read from the forecast endpoint
+ARCHIVE_DELAY = timedelta(days=7)
+
+# Ingests whole seasons with a handful of bulk requests.
+# Rounds already stored are skipped, so a failed run can simply be repeated.
+# CLI: python -m api.backfill 2021 2022
+
+async def fetch_season_results(season):
+    # Season-wide results are paged by result row, a race can be split across pages
+    races = {}
+    offset = 0
+    while True:
+        response = await async_call_data_source("{ergast}/{season}/results.json?limit={limit}&offset={offset}".format(
+            ergast=ERGAST_API_URI, season=season, limit=ERGAST_PAGE_SIZE, offset=offset))
+        for race in response["MRData"]["RaceTable"]["Races"]:
+            round = int(race["round"])
+            if round in races:
+                races[round]["Results"].extend(race["Results"])
+            else:
+                races[round] = race
+        offset += ERGAST_PAGE_SIZE
+        if offset >= int(response["MRData"]["total"]):
+            return races
+
+async def fetch_season_schedule(season):
+    response = await async_call_data_source("{ergast}/{season}.json?limit=100".format(ergast=ERGAST_API_URI, season=season))
+    return {int(race["round"]): race for race in response["MRData"]["RaceTable"]["Races"]}
+
+async def fetch_stored_rounds(season):
+    # One existence query for the whole season
+    races_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {
+            "race.season": season
+        },
+        "projection": {
+            "race.round": 1
+        }
+    }
+    documents = await async_mongodb_api_find(races_find_payload)
+    return {document["race"]["round"] for document in documents}
+
+async def fetch_round_standings(season, round):
+    # Started together for every round, the data source client spaces them out to the Ergast rate limit
+    driver_standing_response = await async_call_data_source(
+        "{ergast}/{season}/{round}/driverStandings.json".format(ergast=ERGAST_API_URI, season=season, round=round))
+    constructor_standing_response = await async_call_data_source(
+        "{ergast}/{season}/{round}/constructorStandings.json".format(ergast=ERGAST_API_URI, season=season, round=round))
+    return driver_standing_response, constructor_standing_response
+
+async def fetch_archive_weather(weekend_keys):
+    # Single archive request for every circuit, each spanning the first qualifying to the last race day
+    if len(weekend_keys) == 0:
+        return {}
+    weather_response = await async_call_data_source(weather_url(OPEN_METEO_ARCHIVE_API_URI + "/archive", weekend_keys))
+    return split_locations(weekend_keys, weather_response)
+
+async def fetch_recent_weather(weekend_keys):
+    if len(weekend_keys) == 0:
+        return {}
+    return await async_get_forecasts(weekend_keys)
+
+async def fetch_season_weather(races):
+    weekend_keys = {round: weekend_key(race) for round, race in races.items()}
+    archived_until = datetime.utcnow().date() - ARCHIVE_DELAY
+    archive_weather, recent_weather = await asyncio.gather(
+        fetch_archive_weather([key for key in weekend_keys.values() if key[3] <= archived_until]),
+        fetch_recent_weather([key for key in weekend_keys.values() if key[3] > archived_until])
+    )
+    weather = {**archive_weather, **recent_weather}
+    return {round: weather[key] for round, key in weekend_keys.items()}
+
+def build_race_data(race, track, weather_response, driver_standing_response, constructor_standing_response, next_race_data):
+    return race_classes.RaceData(
+        race = race_data.build_race_info(race),
+        track = race_data.build_track(track),
+        weather = race_data.build_forecast(weather_response),
+        highlights = race_classes.Highlights(uri = ""),
+        results = race_data.build_results(race),
+        driversStandings = race_data.build_driver_standings(driver_standing_response),
+        constructorsStandings = race_data.build_constructor_standings(constructor_standing_response),
+        nextRace = race_data.build_next_race_info(next_race_data)
+    )
+
+def invalidate_backfilled_races(season, rounds, documents):
+    # Blocks on the shared cache backend, run in a thread
+    for round in rounds:
+        race_data.invalidate_race_data(season, round)
+    race_data.invalidate_latest_race_data()
+    aggregates.add_races(documents)
+
+async def backfill_season(season):
+    schedule, results, stored_rounds = await asyncio.gather(
+        fetch_season_schedule(season),
+        fetch_season_results(season),
+        fetch_stored_rounds(season)
+    )
+    missing_rounds = sorted(round for round in results if round not in stored_rounds)
+    if len(missing_rounds) == 0:
+        return {"status": "Up to date", "season": season, "inserted": 0}
+
+    missing_races = {round: results[round] for round in missing_rounds}
+    # Resolved in memory, an unknown circuit fails before the standings and weather requests
+    tracks = {round: find_track(race["Circuit"]["circuitId"], race["Circuit"]["circuitName"]) for round, race in missing_races.items()}
+    standings, weather = await asyncio.gather(
+        asyncio.gather(*(fetch_round_standings(season, round) for round in missing_rounds)),
+        fetch_season_weather(missing_races)
+    )
+
+    documents = []
+    for round, (driver_standing_response, constructor_standing_response) in zip(missing_rounds, standings):
+        race = missing_races[round]
+        documents.append(build_race_data(
+            race,
+            tracks[round],
+            weather[round],
+            driver_standing_response,
+            constructor_standing_response,
+            schedule.get(round + 1)
+        ).dict())
+
+    # Rounds are written in order and in chunks, a rerun after a failure resumes from the first missing round
+    inserted = 0
+    for start in range(0, len(documents), BACKFILL_CHUNK_SIZE):
+        races_insert_payload = {
+            "dataSource": os.environ.get("MONGODB_CLUSTER"),
+            "database": os.environ.get("DB_NAME"),
+            "collection": "races",
+            "documents": documents[start:start + BACKFILL_CHUNK_SIZE]
+        }
+        insert_response = await async_mongodb_api_insert_many(races_insert_payload)
+        inserted += len(insert_response["insertedIds"])
+
+    await asyncio.to_thread(invalidate_backfilled_races, season, missing_rounds, documents)
+    return {"status": "Successfully backfilled season " + str(season), "season": season, "inserted": inserted}
+
+
+async def main(seasons):
+    try:
+        for season in seasons:
+            print(await backfill_season(season))
+    finally:
+        await data_source_client.aclose()
+        await mongodb_client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main([int(season) for season in sys.argv[1:]]))
@@ -0,0 +1,185 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import timedelta
+
+
+class TTLCache:
+    # Thread-safe TTL cache with single-flight loading.
+    # Expired entries keep being served while one background refresh runs,
+    # until they are older than ttl + max_stale.
+
+    def __init__(self, ttl, max_stale=timedelta(hours=24)):
+        self.ttl = ttl.total_seconds()
+        self.max_stale = max_stale.total_seconds()
+        self._entries = {}
+        self._inflight = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0, "invalidations": 0}
+
+    def get(self, key, loader):
+        return self._get(key, loader, False)
+
+    def get_aged(self, key, loader):
+        # loader returns (value, age in seconds), for values loaded elsewhere before they reached this cache
+        return self._get(key, loader, True)
+
+    def _get(self, key, loader, aged):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, loaded_at = entry
+                age = time.monotonic() - loaded_at
+                if age < self.ttl:
+                    self._stats["hits"] += 1
+                    return value
+                if age < self.ttl + self.max_stale:
+                    self._stats["stale_hits"] += 1
+                    if key not in self._inflight:
+                        flight = self._start_flight(key)
+                        threading.Thread(target=self._load, args=(key, loader, flight, aged), daemon=True).start()
+                    return value
+            self._stats["misses"] += 1
+            flight = self._inflight.get(key)
+            is_owner = flight is None
+            if is_owner:
+                flight = self._start_flight(key)
+        if is_owner:
+            self._load(key, loader, flight, aged)
+        return flight.result()
+
+    def peek(self, key):
+        # Current value regardless of age, without loading or counting
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def invalidate(self, key=None):
+        # Drops one key, or everything when no key is given.
+        # Loads already in flight finish for their waiters but are not stored.
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            if key is None:
+                self._entries.clear()
+                self._inflight.clear()
+            else:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+    def _start_flight(self, key):
+        flight = Future()
+        flight.generation = self._generation
+        self._inflight[key] = flight
+        return flight
+
+    def _load(self, key, loader, flight, aged):
+        try:
+            value, age = loader() if aged else (loader(), 0.0)
+        except BaseException as error:
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.set_exception(error)
+            return
+        with self._lock:
+            self._stats["refreshes"] += 1
+            if flight.generation == self._generation:
+                self._entries[key] = (value, time.monotonic() - age)
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.set_result(value)
+
+
+class LRUCache:
+    # Thread-safe read-through LRU bounded by the total size of its values, no expiry.
+    # Concurrent misses for a key share one load.
+
+    def __init__(self, max_bytes, sizeof=lambda value: value.size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._generation = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get_aged(self, key, loader):
+        # Entries never expire, the age is ignored
+        return self.get(key, lambda: loader()[0])
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            flight = self._inflight.get(key)
+            is_owner = flight is None
+            if is_owner:
+                flight = Future()
+                flight.generation = self._generation
+                self._inflight[key] = flight
+        if is_owner:
+            try:
+                value = loader()
+            except BaseException as error:
+                with self._lock:
+                    if self._inflight.get(key) is flight:
+                        del self._inflight[key]
+                flight.set_exception(error)
+                raise
+            with self._lock:
+                if flight.generation == self._generation:
+                    self._store(key, value)
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.set_result(value)
+        return flight.result()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            if key is None:
+                self._entries.clear()
+                self._inflight.clear()
+                self._bytes = 0
+            else:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
+
+    def _store(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
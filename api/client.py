@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import HTTPException
+
+from .metrics import upstream_circuit_events, upstream_duration
+
+UPSTREAM_TIMEOUT = float(os.environ.get("UPSTREAM_TIMEOUT", 10))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", 5))
+# Waiting for a free pooled connection, requests behind a hung upstream give up instead of queueing
+UPSTREAM_POOL_TIMEOUT = float(os.environ.get("UPSTREAM_POOL_TIMEOUT", 1))
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 2))
+UPSTREAM_BACKOFF = float(os.environ.get("UPSTREAM_BACKOFF", 0.25))
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get("UPSTREAM_MAX_CONNECTIONS", 10))
+# Consecutive failed requests to a host that open its circuit
+UPSTREAM_BREAKER_FAILURES = int(os.environ.get("UPSTREAM_BREAKER_FAILURES", 5))
+# Seconds an open circuit fails fast before a single probe request is let through
+UPSTREAM_BREAKER_RESET = float(os.environ.get("UPSTREAM_BREAKER_RESET", 30))
+
+# Errors raised before the request reached the server, safe to retry for any method
+CONNECTION_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    # closed - requests pass, consecutive failures are counted
+    # open - requests fail fast until UPSTREAM_BREAKER_RESET has passed
+    # half_open - one probe request at a time, its result closes or reopens the circuit
+    # Timeouts, dropped connections and 5xx responses are failures
+
+    def __init__(self, host, failures=UPSTREAM_BREAKER_FAILURES, reset=UPSTREAM_BREAKER_RESET):
+        self.host = host
+        self.failures = failures
+        self.reset = reset
+        self.state = CIRCUIT_CLOSED
+        self._failed = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN and not self._probing:
+                self._probing = True
+                upstream_circuit_events.inc(host=self.host, event="probe")
+                return True
+        upstream_circuit_events.inc(host=self.host, event="rejected")
+        return False
+
+    def record(self, failed):
+        with self._lock:
+            self._probing = False
+            if not failed:
+                if self.state != CIRCUIT_CLOSED:
+                    upstream_circuit_events.inc(host=self.host, event="closed")
+                self.state = CIRCUIT_CLOSED
+                self._failed = 0
+                return
+            self._failed += 1
+            if self.state == CIRCUIT_HALF_OPEN or self._failed >= self.failures:
+                if self.state != CIRCUIT_OPEN:
+                    upstream_circuit_events.inc(host=self.host, event="opened")
+                self.state = CIRCUIT_OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        # Request ended without an upstream result, e.g. cancelled, let the next request probe instead
+        with self._lock:
+            self._probing = False
+
+class RateLimiter:
+    # Token buckets for one upstream, one per (requests, seconds) limit, shared by sync and async callers.
+    # Up to `requests` start at once, after that starts are spread over `seconds`.
+    # Each caller takes a token from every bucket under the lock and waits outside it, queued callers leave
+    # the buckets negative. A caller cancelled before its request started gives its tokens back.
+
+    def __init__(self, limits):
+        self.limits = tuple(limits)
+        self._tokens = [float(requests) for requests, _ in self.limits]
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        for index, (requests, seconds) in enumerate(self.limits):
+            self._tokens[index] = min(requests, self._tokens[index] + elapsed * requests / seconds)
+
+    def reserve(self):
+        # Seconds to wait before starting the request
+        delay = 0.0
+        with self._lock:
+            self._refill()
+            for index, (requests, seconds) in enumerate(self.limits):
+                self._tokens[index] -= 1
+                if self._tokens[index] < 0:
+                    delay = max(delay, -self._tokens[index] * seconds / requests)
+        return delay
+
+    def cancel(self):
+        # The reserved request was never started
+        with self._lock:
+            self._refill()
+            for index, (requests, _) in enumerate(self.limits):
+                self._tokens[index] = min(requests, self._tokens[index] + 1)
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def circuit_breaker(host):
+    # One breaker per upstream, shared by every client calling it
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+class ApiClient:
+    # Keep-alive pooled HTTP client with bounded retries and jittered exponential backoff.
+    # Sync and async clients are created on first use and share the same settings.
+    # Requests to a host whose circuit is open fail fast with a 503.
+    # rate_limits maps "host:port" to (requests, seconds) limits on request starts, retries included.
+
+    def __init__(self, base_url="", headers=None, timeout=UPSTREAM_TIMEOUT, connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+                 retries=UPSTREAM_RETRIES, backoff=UPSTREAM_BACKOFF, max_connections=UPSTREAM_MAX_CONNECTIONS, rate_limits=None):
+        self.base_url = base_url or ""
+        self.headers = headers or {}
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout, pool=UPSTREAM_POOL_TIMEOUT)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.retries = retries
+        self.backoff = backoff
+        self.rate_limiters = {netloc: RateLimiter(limits) for netloc, limits in (rate_limits or {}).items()}
+        self._client = None
+        self._async_client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.Client(base_url=self.base_url, headers=self.headers, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout, limits=self.limits)
+        return self._async_client
+
+    def _backoff_delay(self, attempt, response=None):
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        if response is not None and response.status_code == 429:
+            # Rate limited, wait at least as long as the upstream asks
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+        return delay
+
+    def _should_retry(self, attempt, idempotent, response=None, error=None):
+        if attempt >= self.retries:
+            return False
+        if error is not None:
+            # A timed out or dropped non-idempotent request may already have been applied
+            return idempotent or isinstance(error, CONNECTION_ERRORS)
+        # A rate limited request was rejected before being applied, safe to retry for any method
+        return response.status_code == 429 or (idempotent and response.status_code >= 500)
+
+    def _host(self, url):
+        return urlsplit(url).hostname or urlsplit(self.base_url).hostname
+
+    def _rate_limiter(self, url):
+        return self.rate_limiters.get(urlsplit(url).netloc or urlsplit(self.base_url).netloc)
+
+    def _breaker(self, url):
+        # Keyed by host and port, upstreams sharing a hostname still get their own circuit
+        return circuit_breaker(urlsplit(url).netloc or urlsplit(self.base_url).netloc)
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        host = self._host(url)
+        breaker = self._breaker(url)
+        rate_limiter = self._rate_limiter(url)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise HTTPException(status_code=503, detail="Upstream unavailable")
+            if rate_limiter is not None:
+                time.sleep(rate_limiter.reserve())
+            response = None
+            start = time.perf_counter()
+            try:
+                response = self.client.request(method, url, **kwargs)
+            except httpx.TransportError as error:
+                upstream_duration.observe(time.perf_counter() - start, host=host, status="error")
+                breaker.record(failed=True)
+                if not self._should_retry(attempt, idempotent, error=error):
+                    raise HTTPException(status_code=500, detail="Upstream error")
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                upstream_duration.observe(time.perf_counter() - start, host=host, status=response.status_code)
+                breaker.record(failed=response.status_code >= 500)
+                if not self._should_retry(attempt, idempotent, response=response):
+                    return response
+            time.sleep(self._backoff_delay(attempt, response))
+            attempt += 1
+
+    async def arequest(self, method, url, idempotent=True, **kwargs):
+        host = self._host(url)
+        breaker = self._breaker(url)
+        rate_limiter = self._rate_limiter(url)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise HTTPException(status_code=503, detail="Upstream unavailable")
+            if rate_limiter is not None:
+                delay = rate_limiter.reserve()
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    # Speculative fetches are cancelled while queued, their slot goes to the next request
+                    rate_limiter.cancel()
+                    raise
+            response = None
+            start = time.perf_counter()
+            try:
+                response = await self.async_client.request(method, url, **kwargs)
+            except httpx.TransportError as error:
+                upstream_duration.observe(time.perf_counter() - start, host=host, status="error")
+                breaker.record(failed=True)
+                if not self._should_retry(attempt, idempotent, error=error):
+                    raise HTTPException(status_code=500, detail="Upstream error")
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                upstream_duration.observe(time.perf_counter() - start, host=host, status=response.status_code)
+                breaker.record(failed=response.status_code >= 500)
+                if not self._should_retry(attempt, idempotent, response=response):
+                    return response
+            await asyncio.sleep(self._backoff_delay(attempt, response))
+            attempt += 1
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
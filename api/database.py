@@ -1,9 +1,8 @@
-import requests
 import os
-from dotenv import load_dotenv
-load_dotenv()
 from fastapi import HTTPException
 
+from .client import ApiClient
+
 MONGODB_API_URI = os.environ.get("MONGODB_API_URI")
 MONGODB_API_HEADERS = {
     'Content-Type': 'application/json',
@@ -11,34 +10,64 @@ MONGODB_API_HEADERS = {
     "api-key": os.environ.get("MONGODB_API_KEY")
 }
 
-def mongodb_api_find_one(payload):
-    response = requests.post(MONGODB_API_URI + "/action/find", headers=MONGODB_API_HEADERS, json=payload)
-    # print(response.json())
+mongodb_client = ApiClient(base_url=MONGODB_API_URI, headers=MONGODB_API_HEADERS)
+
+def _find_one_result(response, payload):
     if response.status_code != 200:
         raise HTTPException(status_code=500, detail="Upstream error")
-    if len(response.json()["documents"]) != 1:
+    documents = response.json()["documents"]
+    if len(documents) != 1:
          raise HTTPException(status_code=403, detail=payload["collection"] + " resource not found")
-    return response.json()["documents"][0]
+    return documents[0]
 
-def mongodb_api_is_present(payload):
-    response = requests.post(MONGODB_API_URI + "/action/find", headers=MONGODB_API_HEADERS, json=payload)
-    # print(response.json())
+def _find_result(response):
     if response.status_code != 200:
         raise HTTPException(status_code=500, detail="Upstream error")
-    if len(response.json()["documents"]) == 0:
-        return False
-    else:
-        return True
+    return response.json()["documents"]
 
-def mongodb_api_insert_one(payload):
-    response = requests.post(MONGODB_API_URI + "/action/insertOne", headers=MONGODB_API_HEADERS, json=payload)
-    if response.status_code != 201:
+def _is_present_result(response):
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Upstream error")
+    return len(response.json()["documents"]) != 0
+
+def _write_result(response, expected_status):
+    if response.status_code != expected_status:
         raise HTTPException(status_code=500, detail="Upstream error")
     return response.json()
 
+def mongodb_api_find_one(payload):
+    response = mongodb_client.request("POST", "/action/find", json=payload)
+    return _find_one_result(response, payload)
+
+def mongodb_api_find(payload):
+    response = mongodb_client.request("POST", "/action/find", json=payload)
+    return _find_result(response)
+
+def mongodb_api_is_present(payload):
+    response = mongodb_client.request("POST", "/action/find", json=payload)
+    return _is_present_result(response)
+
+def mongodb_api_insert_one(payload):
+    response = mongodb_client.request("POST", "/action/insertOne", idempotent=False, json=payload)
+    return _write_result(response, 201)
+
 def mongodb_api_update_one(payload):
-    response = requests.post(MONGODB_API_URI + "/action/updateOne", headers=MONGODB_API_HEADERS, json=payload)
-    print(response.json())
-    if response.status_code != 200:
-        raise HTTPException(status_code=500, detail="Upstream error")
-    return response.json()
\ No newline at end of file
+    response = mongodb_client.request("POST", "/action/updateOne", json=payload)
+    return _write_result(response, 200)
+
+
+async def async_mongodb_api_insert_one(payload):
+    response = await mongodb_client.arequest("POST", "/action/insertOne", idempotent=False, json=payload)
+    return _write_result(response, 201)
+
+async def async_mongodb_api_update_one(payload):
+    response = await mongodb_client.arequest("POST", "/action/updateOne", json=payload)
+    return _write_result(response, 200)
+
+async def async_mongodb_api_find(payload):
+    response = await mongodb_client.arequest("POST", "/action/find", json=payload)
+    return _find_result(response)
+
+async def async_mongodb_api_insert_many(payload):
+    response = await mongodb_client.arequest("POST", "/action/insertMany", idempotent=False, json=payload)
+    return _write_result(response, 201)
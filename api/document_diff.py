@@ -0,0 +1,20 @@
+def diff_paths(stored, current, path=""):
+    # Dotted paths and new values for every field of current that differs from stored.
+    # Lists of equal length are compared element by element, otherwise replaced whole.
+    if isinstance(stored, dict) and isinstance(current, dict):
+        changes = {}
+        for key, value in current.items():
+            child_path = path + "." + key if path else key
+            if key not in stored:
+                changes[child_path] = value
+            else:
+                changes.update(diff_paths(stored[key], value, child_path))
+        return changes
+    if isinstance(stored, list) and isinstance(current, list) and len(stored) == len(current):
+        changes = {}
+        for index, (stored_item, current_item) in enumerate(zip(stored, current)):
+            changes.update(diff_paths(stored_item, current_item, path + "." + str(index)))
+        return changes
+    if stored != current:
+        return {path: current}
+    return {}
@@ -0,0 +1,47 @@
+import os
+
+from schemas import race_classes
+
+from .database import async_mongodb_api_find
+
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 50))
+
+# Stored races as newline-delimited JSON, one page of races in memory at a time.
+# Pages continue after the last (season, round) sent rather than skipping, so every page is an index range read
+# and races inserted during the export do not shift the pages.
+
+
+def export_filter(from_season, to_season, after):
+    season_filter = {}
+    if from_season is not None:
+        season_filter["$gte"] = from_season
+    if to_season is not None:
+        season_filter["$lte"] = to_season
+    races_filter = {"race.season": season_filter} if season_filter else {}
+    if after is not None:
+        races_filter["$or"] = [
+            {"race.season": {"$gt": after[0]}},
+            {"race.season": after[0], "race.round": {"$gt": after[1]}}
+        ]
+    return races_filter
+
+async def export_races(from_season=None, to_season=None):
+    after = None
+    while True:
+        races_find_payload = {
+            "dataSource": os.environ.get("MONGODB_CLUSTER"),
+            "database": os.environ.get("DB_NAME"),
+            "collection": "races",
+            "filter": export_filter(from_season, to_season, after),
+            "sort": {
+                "race.season": 1,
+                "race.round": 1
+            },
+            "limit": EXPORT_PAGE_SIZE
+        }
+        races = await async_mongodb_api_find(races_find_payload)
+        for race in races:
+            yield race_classes.RaceData.parse_obj(race).json() + "\n"
+        if len(races) < EXPORT_PAGE_SIZE:
+            return
+        after = (races[-1]["race"]["season"], races[-1]["race"]["round"])
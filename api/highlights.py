@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+from fastapi import HTTPException
+
+from .cache import TTLCache
+
+from .database import mongodb_api_find, mongodb_api_update_one
+
+from .metrics import register_cache, span
+
+from .race_data import get_latest_race_data, invalidate_latest_race_data, invalidate_race_data
+
+from .sources import YOUTUBE_SEARCH_URI
+
+from .tracks import normalise_name
+
+from .utils import call_data_source
+
+HIGHLIGHTS_CHANNEL_ID = "UCB_qr75-ydFVKSF9Dmo6izg"
+HIGHLIGHTS_EMBED_URI = "https://www.youtube.com/embed/"
+# Races without highlights are searched for until this long after the race start
+HIGHLIGHTS_WINDOW = timedelta(hours=float(os.environ.get("HIGHLIGHTS_WINDOW_HOURS", 72)))
+# Search results are reused for this long, so the worker and the cron endpoint share one search
+HIGHLIGHTS_SEARCH_TTL = timedelta(seconds=float(os.environ.get("HIGHLIGHTS_SEARCH_TTL", 120)))
+HIGHLIGHTS_WORKER = os.environ.get("HIGHLIGHTS_WORKER", "false").lower() == "true"
+HIGHLIGHTS_POLL_BASE = float(os.environ.get("HIGHLIGHTS_POLL_BASE", 300))
+HIGHLIGHTS_POLL_MAX = float(os.environ.get("HIGHLIGHTS_POLL_MAX", 3600))
+HIGHLIGHTS_IDLE_INTERVAL = float(os.environ.get("HIGHLIGHTS_IDLE_INTERVAL", 900))
+
+DATETIME_UTC_FORMAT = "%Y-%m-%d %H:%M:%S GMT"
+TITLE_PATTERN = re.compile(r"^Race Highlights \| (\d{4}) (.* Grand Prix)")
+PUBLISHED_PATTERN = re.compile(r"^(?:streamed )?(\d+) (second|minute|hour|day|week|month|year)s? ago$")
+UNIT_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400, "week": 604800, "month": 2592000, "year": 31536000}
+
+search_cache = TTLCache(ttl=HIGHLIGHTS_SEARCH_TTL, max_stale=timedelta(0))
+register_cache("highlights_search", search_cache)
+
+logger = logging.getLogger(__name__)
+worker_task = None
+worker_wakeup = None
+
+
+def search_channel(query):
+    if YOUTUBE_SEARCH_URI:
+        return call_data_source(YOUTUBE_SEARCH_URI + "?" + urlencode({"query": query, "channel": HIGHLIGHTS_CHANNEL_ID}))
+    # Only the highlights search uses the YouTube client, keep it out of cold starts
+    from youtubesearchpython import ChannelSearch, ResultMode
+    return ChannelSearch(query, HIGHLIGHTS_CHANNEL_ID, 'en', 'US').result(mode = ResultMode.dict)
+
+def search_highlights(season):
+    # Relative publish times only make sense against the time of the search, keep both
+    def load():
+        with span("highlights_search"):
+            search = search_channel("Race Highlights | " + str(season))
+        return datetime.now(timezone.utc), search["result"]
+    return search_cache.get(season, load)
+
+def published_before(published, searched_at):
+    # Latest time a video shown as "3 hours ago" can have been published, None if unknown
+    match = PUBLISHED_PATTERN.match(str(published).strip().lower())
+    if match is None:
+        return None
+    return searched_at - timedelta(seconds=int(match.group(1)) * UNIT_SECONDS[match.group(2)])
+
+def race_start(race):
+    return datetime.strptime(race["race"]["dateTimeUtc"], DATETIME_UTC_FORMAT).replace(tzinfo=timezone.utc)
+
+def race_label(race):
+    return str(race["race"]["season"]) + " - Round " + str(race["race"]["round"])
+
+def match_highlights(races, searched_at, videos):
+    # Pairs pending races of one season with the first video titled for them and published after the start
+    # Names are compared without case or accents, e.g. Ergast's "São Paulo Grand Prix" and a "Sao Paulo Grand Prix" title
+    races_by_name = {normalise_name(race["race"]["name"]): race for race in races}
+    matches = {}
+    for video in videos:
+        title = TITLE_PATTERN.match(str(video["title"]))
+        if title is None:
+            continue
+        name = normalise_name(title.group(2))
+        race = races_by_name.get(name)
+        if race is None or int(title.group(1)) != race["race"]["season"] or name in matches:
+            continue
+        published = published_before(video.get("published"), searched_at)
+        if published is None or published < race_start(race):
+            continue
+        matches[name] = (race, str(video["uri"]))
+    return list(matches.values())
+
+def find_pending_races():
+    races_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {
+            "highlights.uri": "",
+            # dateTimeUtc is stored as a sortable string
+            "race.dateTimeUtc": {
+                "$gte": (datetime.now(timezone.utc) - HIGHLIGHTS_WINDOW).strftime(DATETIME_UTC_FORMAT)
+            }
+        },
+        "projection": {
+            "race": 1
+        }
+    }
+    return mongodb_api_find(races_find_payload)
+
+def store_highlights(race, video_uri):
+    highlights_update_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {
+            "_id": {
+                "$oid": str(race["_id"])
+            }
+        },
+        "update": {
+            "$set": {
+                "highlights.uri": HIGHLIGHTS_EMBED_URI + video_uri.replace("/watch?v=", "")
+            }
+        }
+    }
+    update_response = mongodb_api_update_one(highlights_update_payload)
+    if "modifiedCount" in update_response and update_response["modifiedCount"] == 1:
+        # Clear cache so next call will contain highlights
+        invalidate_latest_race_data()
+        invalidate_race_data(race["race"]["season"], race["race"]["round"])
+    else:
+        raise HTTPException(status_code=400, detail="Updating highlights data failed")
+
+def find_highlights():
+    # One channel search per season covers every race still waiting for highlights
+    pending_races = find_pending_races()
+    if len(pending_races) == 0:
+        return {"status": "No races waiting for highlights", "pending": []}
+
+    races_by_season = {}
+    for race in pending_races:
+        races_by_season.setdefault(race["race"]["season"], []).append(race)
+    found = []
+    for season, races in races_by_season.items():
+        searched_at, videos = search_highlights(season)
+        for race, video_uri in match_highlights(races, searched_at, videos):
+            store_highlights(race, video_uri)
+            found.append(race_label(race))
+    if len(found) != 0:
+        # Rebuild the payload dropped by the update before traffic asks for it
+        get_latest_race_data()
+
+    pending = [race_label(race) for race in pending_races if race_label(race) not in found]
+    if len(found) == 0:
+        return {"status": "Couldn't find highlights for " + ", ".join(pending), "pending": pending}
+    return {"status": "Successfully added highlights for " + ", ".join(found), "pending": pending}
+
+async def highlights_worker():
+    # Polls often right after a race, backing off while highlights are still missing
+    attempt = 0
+    previous_pending = set()
+    while True:
+        try:
+            pending = set((await asyncio.to_thread(find_highlights))["pending"])
+        except Exception:
+            logger.exception("Highlights search failed")
+            pending = previous_pending
+        if len(pending - previous_pending) != 0:
+            # A newly finished race starts again at the shortest interval
+            attempt = 0
+        previous_pending = pending
+        if len(pending) == 0:
+            attempt = 0
+            delay = HIGHLIGHTS_IDLE_INTERVAL
+        else:
+            delay = min(HIGHLIGHTS_POLL_BASE * 2 ** attempt, HIGHLIGHTS_POLL_MAX)
+            attempt += 1
+        try:
+            await asyncio.wait_for(worker_wakeup.wait(), delay)
+            # Woken for a newly stored race, start again at the shortest interval
+            worker_wakeup.clear()
+            attempt = 0
+        except asyncio.TimeoutError:
+            pass
+
+def start_worker():
+    global worker_task, worker_wakeup
+    if worker_task is None:
+        worker_wakeup = asyncio.Event()
+        worker_task = asyncio.create_task(highlights_worker())
+
+def wake_worker():
+    if worker_wakeup is not None:
+        worker_wakeup.set()
+
+async def stop_worker():
+    global worker_task
+    if worker_task is not None:
+        worker_task.cancel()
+        await asyncio.gather(worker_task, return_exceptions=True)
+        worker_task = None
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+
+from .metrics import Counter
+
+# Seconds between checks of the latest payload while anyone is subscribed, picks up changes made by other workers
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", 30))
+# Proxies close idle connections, a comment line keeps SSE streams open
+LIVE_KEEPALIVE_INTERVAL = 15
+# Messages a slow subscriber may fall behind before it is sent a full snapshot instead
+LIVE_QUEUE_SIZE = 16
+
+# Pushes the latest RaceData to SSE and WebSocket subscribers.
+# Changes only set an event, one broadcaster task reloads the payload and sends the top level sections that differ,
+# so a change costs one cached load and one encoding however many clients are connected.
+#   snapshot - every section, sent on connect
+#   update - changed sections only
+
+logger = logging.getLogger(__name__)
+live_messages = Counter("simplef1_live_messages_total", "Messages pushed to live subscribers", ("event",))
+
+broadcaster_task = None
+_loader = None
+_loop = None
+_changed = None
+_subscribers = set()
+_etag = None
+_sections = None
+
+
+def notify_latest_changed():
+    # Safe to call from worker threads and with no broadcaster running
+    loop = _loop
+    if loop is None:
+        return
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        _changed.set()
+        return
+    try:
+        loop.call_soon_threadsafe(_changed.set)
+    except RuntimeError:
+        # Loop already closed at shutdown
+        pass
+
+def _snapshot_message():
+    return ("snapshot", json.dumps(_sections))
+
+def _publish(payload):
+    global _etag, _sections
+    if payload.etag == _etag:
+        return
+    sections = json.loads(payload.body)
+    previous = _sections
+    _etag = payload.etag
+    _sections = sections
+    if previous is None:
+        return
+    changed = {name: value for name, value in sections.items() if previous.get(name) != value}
+    if len(changed) == 0:
+        return
+    message = ("update", json.dumps(changed))
+    for queue in _subscribers:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # The missed updates are replaced by the whole payload
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(_snapshot_message())
+            live_messages.inc(event="snapshot")
+            continue
+        live_messages.inc(event="update")
+
+async def _load():
+    _publish(await asyncio.to_thread(_loader))
+
+async def broadcaster():
+    while True:
+        try:
+            await asyncio.wait_for(_changed.wait(), LIVE_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _changed.clear()
+        if len(_subscribers) == 0:
+            continue
+        try:
+            await _load()
+        except Exception:
+            logger.exception("Loading the latest race data for subscribers failed")
+
+async def subscribe():
+    # Raises before anything is streamed when there is no latest race to send
+    await _load()
+    queue = asyncio.Queue(LIVE_QUEUE_SIZE)
+    queue.put_nowait(_snapshot_message())
+    live_messages.inc(event="snapshot")
+    _subscribers.add(queue)
+    return queue
+
+def unsubscribe(queue):
+    _subscribers.discard(queue)
+
+async def event_stream(queue):
+    try:
+        while True:
+            try:
+                event, data = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield "event: " + event + "\ndata: " + data + "\n\n"
+    finally:
+        unsubscribe(queue)
+
+async def serve_websocket(websocket, queue):
+    # Messages from the client are ignored, receiving only notices the disconnect
+    receive = asyncio.create_task(websocket.receive())
+    try:
+        while True:
+            get = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({get, receive}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                event, data = get.result()
+                await websocket.send_text("{\"event\": \"" + event + "\", \"data\": " + data + "}")
+            else:
+                get.cancel()
+            if receive in done:
+                if receive.result()["type"] == "websocket.disconnect":
+                    return
+                receive = asyncio.create_task(websocket.receive())
+    finally:
+        receive.cancel()
+        unsubscribe(queue)
+
+def start_broadcaster(loader):
+    global broadcaster_task, _loader, _loop, _changed
+    if broadcaster_task is None:
+        _loader = loader
+        _loop = asyncio.get_running_loop()
+        _changed = asyncio.Event()
+        broadcaster_task = asyncio.create_task(broadcaster())
+
+async def stop_broadcaster():
+    global broadcaster_task, _loop
+    if broadcaster_task is not None:
+        _loop = None
+        broadcaster_task.cancel()
+        await asyncio.gather(broadcaster_task, return_exceptions=True)
+        broadcaster_task = None
@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Minimal in-process metrics rendered in the Prometheus text format.
+# Recording is a dict lookup and a few additions under a lock, cheap enough to leave on.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_metrics = []
+_caches = {}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join("{name}=\"{value}\"".format(name=name, value=_escape(value)) for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = ["# HELP {name} {help}".format(name=self.name, help=self.help), "# TYPE {name} counter".format(name=self.name)]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append("{name}{labels} {value}".format(name=self.name, labels=_format_labels(self.label_names, key), value=value))
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {"count": series[-1], "sum": series[-2]} for key, series in self._values.items()}
+
+    def render(self):
+        lines = ["# HELP {name} {help}".format(name=self.name, help=self.help), "# TYPE {name} histogram".format(name=self.name)]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append("{name}_bucket{labels} {value}".format(
+                        name=self.name, labels=_format_labels(self.label_names, key, [("le", repr(bound))]), value=cumulative))
+                lines.append("{name}_bucket{labels} {value}".format(
+                    name=self.name, labels=_format_labels(self.label_names, key, [("le", "+Inf")]), value=series[-1]))
+                lines.append("{name}_sum{labels} {value}".format(name=self.name, labels=_format_labels(self.label_names, key), value=series[-2]))
+                lines.append("{name}_count{labels} {value}".format(name=self.name, labels=_format_labels(self.label_names, key), value=series[-1]))
+        return lines
+
+
+stage_duration = Histogram("simplef1_stage_duration_seconds", "Duration of race data pipeline stages", ("stage",))
+upstream_duration = Histogram("simplef1_upstream_request_duration_seconds", "Duration of upstream HTTP requests", ("host", "status"))
+upstream_cache_events = Counter("simplef1_upstream_cache_total", "Upstream response cache lookups", ("result",))
+upstream_circuit_events = Counter("simplef1_upstream_circuit_total", "Upstream circuit breaker transitions and rejected requests", ("host", "event"))
+
+
+def span(stage):
+    return stage_duration.time(stage=stage)
+
+async def timed(stage, awaitable):
+    # Times a single awaitable, e.g. one of several fetches started at once.
+    # Cancelled or failed awaits are left out, upstream errors are counted per request.
+    start = time.perf_counter()
+    result = await awaitable
+    stage_duration.observe(time.perf_counter() - start, stage=stage)
+    return result
+
+def register_cache(name, cache):
+    # Cache counters are read from cache.stats() at scrape time, nothing is added to the read path
+    _caches[name] = cache
+
+def _render_caches():
+    series = {}
+    for name, cache in sorted(_caches.items()):
+        for key, value in cache.stats().items():
+            series.setdefault(key, []).append((name, value))
+    lines = []
+    for key, values in sorted(series.items()):
+        if key in ("entries", "bytes"):
+            metric, kind = "simplef1_cache_" + key, "gauge"
+        else:
+            metric, kind = "simplef1_cache_" + key + "_total", "counter"
+        lines.append("# TYPE {metric} {kind}".format(metric=metric, kind=kind))
+        for name, value in values:
+            lines.append("{metric}{labels} {value}".format(metric=metric, labels=_format_labels(("cache",), (name,)), value=value))
+    return lines
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    lines.extend(_render_caches())
+    return "\n".join(lines) + "\n"
@@ -1,97 +1,217 @@
+import asyncio
 from schemas import race_classes
-import requests_cache
 from fastapi import HTTPException
 import re
-from datetime import datetime, timedelta, date
-from pathlib import Path
-from tzwhere import tzwhere
-import pytz
-from youtubesearchpython import ChannelSearch, ResultMode, CustomSearch, VideoSortOrder
+import struct
+import tempfile
+import logging
+from datetime import datetime, timedelta
 
 import os
-from dotenv import load_dotenv
-load_dotenv()
 
-from .utils import call_data_source
+from .utils import call_data_source, async_call_data_source
+
+from .sources import ERGAST_API_URI
 
 from .weather_code_converter import convert_weather_code
 
-from .database import mongodb_api_find_one, mongodb_api_insert_one, mongodb_api_is_present, mongodb_api_update_one
+from .weather import async_get_forecasts, get_forecasts, weekend_key
+
+from .timezones import find_timezone
+
+from .tracks import find_track
+
+from .cache import LRUCache, TTLCache
+
+from .responses import pack_payload, render_model, render_models, unpack_payload
+
+from .shared_cache import shared_cache
+
+from .metrics import Counter, register_cache, span, timed
 
-TRACK_INFORMATION = Path(__file__).parent /"./../data/tracks.csv"
-HIGHLIGHTS_INFORMATION = Path(__file__).parent /"./../data/highlights.csv"
-tz = tzwhere.tzwhere()
+from .database import mongodb_api_find, mongodb_api_find_one
+from .database import async_mongodb_api_find, async_mongodb_api_insert_one, async_mongodb_api_update_one
 
-cache = {}
+from .document_diff import diff_paths
+
+from .aggregates import add_races as add_aggregate_races
+
+from .live import notify_latest_changed
+
+# Ergast omits start times for older races
+DEFAULT_RACE_TIME = "00:00:00Z"
+LAPPED_PATTERN = re.compile(r"\+\d Lap[s]?")
+# Last /api/latest payload this host served, kept on disk so a cold start with the database unreachable still has an answer
+LATEST_SNAPSHOT_PATH = os.environ.get("LATEST_SNAPSHOT_PATH", os.path.join(tempfile.gettempdir(), "simplef1_latest.snapshot"))
+UP_TO_DATE_STATUS = "Up to date"
+
+# Caches hold rendered payloads, shared between workers when CACHE_BACKEND selects a backend
+# In-memory caching response - 15 minutes, stale value served while refreshing
+latest_race_cache = shared_cache("latest", TTLCache(ttl=timedelta(minutes=15)), pack_payload, unpack_payload, ttl=15 * 60)
+# Finished races never change, history is only evicted when the size bound is reached
+race_history_cache = shared_cache("history", LRUCache(max_bytes=int(os.environ.get("HISTORY_CACHE_MAX_BYTES", 32 * 1024 * 1024))), pack_payload, unpack_payload)
+# Rebuilt from the forecast cache, Open-Meteo is only called when a forecast has expired
+next_weather_cache = shared_cache("next_weather", TTLCache(ttl=timedelta(minutes=30)), pack_payload, unpack_payload, ttl=30 * 60)
+register_cache("latest", latest_race_cache)
+register_cache("history", race_history_cache)
+register_cache("next_weather", next_weather_cache)
+latest_snapshot_served = Counter("simplef1_latest_snapshot_served_total", "Latest race responses served from the last known good snapshot")
+
+logger = logging.getLogger(__name__)
+latest_snapshot = None
 
 def get_latest_race_data():
-    # Simple in-memory caching response - 15 minutes 
-    global cache
-    if "race_data" in cache:
-        if cache["expiry"] > datetime.now():
-            return cache["race_data"]
-        else:
-            cache = {}
+    try:
+        payload = latest_race_cache.get("race_data", load_latest_race_data)
+    except HTTPException as error:
+        # Database down or its circuit open with nothing cached, answer with the last race served instead
+        snapshot = load_latest_snapshot() if error.status_code >= 500 else None
+        if snapshot is None:
+            raise
+        latest_snapshot_served.inc()
+        return snapshot
+    save_latest_snapshot(payload)
+    return payload
 
-    race_response = call_data_source("http://ergast.com/api/f1/current/last/results.json")
-    race = race_response["MRData"]["RaceTable"]["Races"][0]
+def save_latest_snapshot(payload):
+    global latest_snapshot
+    # Written once per new payload, every other request only compares the ETag
+    if latest_snapshot is not None and latest_snapshot.etag == payload.etag:
+        return
+    latest_snapshot = payload
+    temporary_path = LATEST_SNAPSHOT_PATH + "." + str(os.getpid())
+    try:
+        with open(temporary_path, "wb") as file:
+            file.write(pack_payload(payload))
+        os.replace(temporary_path, LATEST_SNAPSHOT_PATH)
+    except OSError:
+        logger.exception("Saving the latest race snapshot failed")
 
-    # Check if race data is stored in database
+def load_latest_snapshot():
+    global latest_snapshot
+    if latest_snapshot is None:
+        try:
+            with open(LATEST_SNAPSHOT_PATH, "rb") as file:
+                latest_snapshot = unpack_payload(file.read())
+        except (OSError, struct.error):
+            return None
+    return latest_snapshot
+
+@span("latest_load")
+def load_latest_race_data():
+    # Latest stored race is the highest season and round, no Ergast round trip needed
+    # Served by walking the unique { "race.season": 1, "race.round": 1 } index on races backwards
     race_find_payload = {
         "dataSource": os.environ.get("MONGODB_CLUSTER"),
         "database": os.environ.get("DB_NAME"),
         "collection": "races",
-        "filter": {
-            "race.season": int(race["season"]),
-            "race.round": int(race["round"])
-      }
+        "filter": {},
+        "sort": {
+            "race.season": -1,
+            "race.round": -1
+        },
+        "limit": 1
     }
     race_response = mongodb_api_find_one(race_find_payload)
     if "race" in race_response:
-        cache.update({"race_data": race_response})
-        expiry = datetime.now() + timedelta(minutes=15)
-        cache.update({"expiry": expiry})
-        return race_response
+        # Validate and serialise once per load, requests only copy the rendered bytes
+        return render_model(race_classes.RaceData.parse_obj(race_response))
     
     raise HTTPException(status_code=400, detail="Error during processing")
 
+def invalidate_latest_race_data():
+    latest_race_cache.invalidate("race_data")
+    notify_latest_changed()
 
-def update_latest_race_data():
-    # Enable in dev env
-    # requests_cache.install_cache("race_data_responses", allowable_methods=('GET'), allowable_codes=(200,), urls_expire_after={"http://ergast.com/api/f1/": 36000, })
-    
-    race_response = call_data_source("http://ergast.com/api/f1/current/last/results.json")
-    race = race_response["MRData"]["RaceTable"]["Races"][0]
+def get_next_race_weather():
+    return next_weather_cache.get("next_weather", load_next_race_weather)
 
-    # Check if race data is stored in database
+@span("next_weather_load")
+def load_next_race_weather():
+    next_race_response = call_data_source(ERGAST_API_URI + "/current/next.json")
+    next_race_data = None
+    forecast = None
+    if int(next_race_response["MRData"]["total"]) > 0:
+        next_race_data = next_race_response["MRData"]["RaceTable"]["Races"][0]
+        next_weekend_key = weekend_key(next_race_data)
+        forecast = get_forecasts([next_weekend_key])[next_weekend_key]
+    return render_model(race_classes.NextRaceWeather(
+        nextRace = build_next_race_info(next_race_data),
+        weather = build_forecast(forecast)
+    ))
+
+def get_race_data(season, round):
+    return race_history_cache.get("race:" + str(season) + ":" + str(round), lambda: load_race_data(season, round))
+
+def load_race_data(season, round):
     race_find_payload = {
         "dataSource": os.environ.get("MONGODB_CLUSTER"),
         "database": os.environ.get("DB_NAME"),
         "collection": "races",
         "filter": {
-            "race.season": int(race["season"]),
-            "race.round": int(race["round"])
+            "race.season": season,
+            "race.round": round
       }
     }
-    is_race_present = mongodb_api_is_present(race_find_payload)
-    if is_race_present == True:
-        return {"status": "Up to date"}
+    race_response = mongodb_api_find_one(race_find_payload)
+    return render_model(race_classes.RaceData.parse_obj(race_response))
+
+def get_season_race_data(season):
+    return race_history_cache.get("season:" + str(season), lambda: load_season_race_data(season))
+
+def load_season_race_data(season):
+    races_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {
+            "race.season": season
+        },
+        "sort": {
+            "race.round": 1
+        }
+    }
+    races_response = mongodb_api_find(races_find_payload)
+    if len(races_response) == 0:
+        raise HTTPException(status_code=403, detail="races resource not found")
+    return render_models(race_classes.RaceData.parse_obj(race) for race in races_response)
+
+def invalidate_race_data(season, round):
+    race_history_cache.invalidate("race:" + str(season) + ":" + str(round))
+    race_history_cache.invalidate("season:" + str(season))
+
+def invalidate_stored_race(race):
+    # After a race is inserted or changed, blocks on the shared cache backend so async callers run it in a thread
+    invalidate_latest_race_data()
+    next_weather_cache.invalidate()
+    invalidate_race_data(race["race"]["season"], race["race"]["round"])
+    add_aggregate_races([race])
+
 
+
+def driver_code(driver):
+    # Ergast only has three letter codes from 2005 onwards
+    return driver.get("code", driver["familyName"][:3].upper())
+
+def build_race_info(race):
     # Find race timezone
-    timezone = tz.tzNameAt(
-        float(race["Circuit"]["Location"]["lat"]),
-        float(race["Circuit"]["Location"]["long"])
-    )
+    with span("timezone_lookup"):
+        timezone = find_timezone(
+            float(race["Circuit"]["Location"]["lat"]),
+            float(race["Circuit"]["Location"]["long"])
+        )
+    # Only ingestion converts timezones, pytz stays out of cold starts
+    import pytz
     race_timezone = pytz.timezone(timezone)
     # Create datetime object 
-    race_datetime_str = str(race["date"]) + " " + str(race["time"])
+    race_datetime_str = str(race["date"]) + " " + str(race.get("time", DEFAULT_RACE_TIME))
     race_datetime = datetime.strptime(race_datetime_str, "%Y-%m-%d %H:%M:%SZ")
     # Set datetime to greenwich time
     gmt = pytz.timezone('GMT')
     race_datetime_gmt = gmt.localize(race_datetime)
 
     # Convert datetime to race location timezone
-    race_info = race_classes.RaceInfo(
+    return race_classes.RaceInfo(
         name = race["raceName"],
         city = race["Circuit"]["Location"]["locality"],
         country = race["Circuit"]["Location"]["country"],
@@ -101,57 +221,10 @@ def update_latest_race_data():
         dateTimeUtc = race_datetime_gmt.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S GMT")
     )
 
-    # Track data
-    # Set default values
-    track_name=map_uri = ""
-    turns=length=laps=drs_detection_zones=drs_zones=distance=0
-    track_find_payload = {
-        "dataSource": os.environ.get("MONGODB_CLUSTER"),
-        "database": os.environ.get("DB_NAME"),
-        "collection": "tracks",
-        "filter": {
-            "name": race["Circuit"]["circuitName"]
-      }
-    }
-    
-    track_response = mongodb_api_find_one(track_find_payload)
-    if "name" in track_response:
-        track_name = track_response["name"]
-        map_uri = track_response["mapUri"]
-        turns = track_response["turns"]
-        length = track_response["length"]
-        laps = track_response["laps"]
-        distance = track_response["distance"]
-        drs_detection_zones = track_response["drsDetectionZones"]
-        drs_zones = track_response["drsZones"]
-    # Save track data
-    track = race_classes.Track(
-        name = track_name,
-        mapUri = map_uri,
-        turns = turns,
-        length = length,
-        laps = laps,
-        drsDetectionZones = drs_detection_zones,
-        drsZones = drs_zones,
-        distance = distance
-    )
-    
-    # Highlights data
-    # Store black highlights link
-    # Will retrieve highlights in separate cron job call
-    highlights_uri = ""
-    highlights = race_classes.Highlights(
-        uri = highlights_uri
-    )  
-
-    # Weather data
-    weather_url = "https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={long}&daily=weathercode,temperature_2m_max,temperature_2m_min,precipitation_sum&timezone=auto&start_date={quali_date}&end_date={race_date}".format(
-        lat=race["Circuit"]["Location"]["lat"],
-        long=race["Circuit"]["Location"]["long"],
-        quali_date=(datetime.strptime(race["date"], "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d"),
-        race_date=race["date"]
-    )
-    weather_response = call_data_source(weather_url)
+def build_track(track):
+    return race_classes.Track(**track._asdict())
+
+def build_weather(weather_response):
     quali_weather = race_classes.WeatherEntry(
         type = convert_weather_code(str(weather_response["daily"]["weathercode"][0])),
         temp = str(weather_response["daily"]["temperature_2m_min"][0]) + "°C - " + str(weather_response["daily"]["temperature_2m_max"][0]) + "°C",
@@ -160,17 +233,30 @@ def update_latest_race_data():
         type = convert_weather_code(str(weather_response["daily"]["weathercode"][1])),
         temp = str(weather_response["daily"]["temperature_2m_min"][1]) + "°C - " + str(weather_response["daily"]["temperature_2m_max"][1]) + "°C"
     )
-    weather = race_classes.Weather(
+    return race_classes.Weather(
         qualifying = quali_weather,
         race = race_weather
     )
-    
-    # Race result data
+
+def build_forecast(forecast):
+    # Weekends past the forecast horizon have no weather yet
+    if forecast is None:
+        unknown_weather = race_classes.WeatherEntry(
+            type = "-",
+            temp = "-"
+        )
+        return race_classes.Weather(
+            qualifying = unknown_weather,
+            race = unknown_weather
+        )
+    return build_weather(forecast)
+
+def build_results(race):
     race_results = []
     for entry in race["Results"]:
         # Handle timings after 1 lap and DNFs
         if entry["status"] != "Finished":
-            if re.search("\+\d Lap[s]?", entry["status"]):
+            if LAPPED_PATTERN.search(entry["status"]):
                 race_time = entry["status"]
             else:
                 race_time = "DNF"
@@ -187,7 +273,7 @@ def update_latest_race_data():
             position = entry["position"],
             qualifying = entry["grid"],
             name = entry["Driver"]["givenName"] + " " + entry["Driver"]["familyName"],
-            driverCode = entry["Driver"]["code"],
+            driverCode = driver_code(entry["Driver"]),
             time = race_time,
             points = entry["points"],
             team = entry["Constructor"]["name"],
@@ -199,9 +285,9 @@ def update_latest_race_data():
             positionChange =  int(entry["grid"]) - int(entry["position"])
         )
         race_results.append(driver_standing_entry)
+    return race_results
 
-    # Drivers standings data
-    driver_standing_response = call_data_source("http://ergast.com/api/f1/current/driverStandings.json")
+def build_driver_standings(driver_standing_response):
     if driver_standing_response == {}:
         raise HTTPException(status_code=503, detail="Upstream error")
     driver_standing = []
@@ -209,16 +295,16 @@ def update_latest_race_data():
         driver_standing_entry = race_classes.DriverStandingEntry(
             position = entry["position"],
             name = entry["Driver"]["givenName"] + " " + entry["Driver"]["familyName"],
-            driverCode = entry["Driver"]["code"],
+            driverCode = driver_code(entry["Driver"]),
             points = entry["points"],
             team = entry["Constructors"][0]["name"],
             teamLogoUri = entry["Constructors"][0]["name"].replace(" ",""),
             teamLogoAlt = entry["Constructors"][0]["name"] + " logo"
         )
         driver_standing.append(driver_standing_entry)
+    return driver_standing
 
-    # Constructors standings data
-    constructor_standing_response = call_data_source("http://ergast.com/api/f1/current/constructorStandings.json")
+def build_constructor_standings(constructor_standing_response):
     if constructor_standing_response == {}:
         raise HTTPException(status_code=503, detail="Upstream error")
     constructor_standing = []
@@ -231,39 +317,117 @@ def update_latest_race_data():
             teamLogoAlt = entry["Constructor"]["name"] + " logo"
         )
         constructor_standing.append(constructor_standing_entry)
+    return constructor_standing
 
-    # Next race data    
-    url = "http://ergast.com/api/f1/{year}/{round}.json".format(year=race_info.season, round=race_info.round + 1)
-    next_race_response = call_data_source(url)
+def build_next_race(next_race_response):
     if next_race_response == {}:
         raise HTTPException(status_code=503, detail="Upstream error")
     if int(next_race_response["MRData"]["total"]) > 0: 
-        next_race_data = next_race_response["MRData"]["RaceTable"]["Races"][0]
-        # Find race timezone
-        timezone = tz.tzNameAt(float(next_race_data["Circuit"]["Location"]["lat"]),float(next_race_data["Circuit"]["Location"]["long"]))
-        next_race_timezone = pytz.timezone(timezone)
-        # Create datetime object 
-        next_race_datetime_str = str(next_race_data["date"]) + " " + str(next_race_data["time"])
-        next_race_datetime = datetime.strptime(next_race_datetime_str, "%Y-%m-%d %H:%M:%SZ")
-        # Set datetime to greenwich time
-        gmt = pytz.timezone('GMT')
-        next_race_datetime_gmt = gmt.localize(next_race_datetime)
-        
-        next_race = race_classes.NextRace(
-            name = next_race_data["raceName"],
-            country = next_race_data["Circuit"]["Location"]["country"],
-            track = next_race_data["Circuit"]["circuitName"],
-            raceDateTime = next_race_datetime_gmt.astimezone(next_race_timezone).strftime("%Y-%m-%d %H:%M:%S"),
-            dateTimeUtc = next_race_datetime_gmt.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S GMT"),
-        )
-    else:
-        next_race = race_classes.NextRace(
+        return build_next_race_info(next_race_response["MRData"]["RaceTable"]["Races"][0])
+    return build_next_race_info(None)
+
+def build_next_race_info(next_race_data):
+    if next_race_data is None:
+        return race_classes.NextRace(
             name = "-",
             country = "-",
             track = "-",
             raceDateTime = "-",
             dateTimeUtc = "-",
         )
+    # Find race timezone
+    with span("timezone_lookup"):
+        timezone = find_timezone(float(next_race_data["Circuit"]["Location"]["lat"]),float(next_race_data["Circuit"]["Location"]["long"]))
+    import pytz
+    next_race_timezone = pytz.timezone(timezone)
+    # Create datetime object 
+    next_race_datetime_str = str(next_race_data["date"]) + " " + str(next_race_data.get("time", DEFAULT_RACE_TIME))
+    next_race_datetime = datetime.strptime(next_race_datetime_str, "%Y-%m-%d %H:%M:%SZ")
+    # Set datetime to greenwich time
+    gmt = pytz.timezone('GMT')
+    next_race_datetime_gmt = gmt.localize(next_race_datetime)
+    
+    return race_classes.NextRace(
+        name = next_race_data["raceName"],
+        country = next_race_data["Circuit"]["Location"]["country"],
+        track = next_race_data["Circuit"]["circuitName"],
+        raceDateTime = next_race_datetime_gmt.astimezone(next_race_timezone).strftime("%Y-%m-%d %H:%M:%S"),
+        dateTimeUtc = next_race_datetime_gmt.astimezone(pytz.utc).strftime("%Y-%m-%d %H:%M:%S GMT"),
+    )
+
+async def fetch_weekend_weather(race, next_race_task):
+    # The finished race and the next one share a forecast request, /api/next/weather then starts warm
+    weekend_keys = [weekend_key(race)]
+    next_race_response = await next_race_task
+    if next_race_response != {} and int(next_race_response["MRData"]["total"]) > 0:
+        weekend_keys.append(weekend_key(next_race_response["MRData"]["RaceTable"]["Races"][0]))
+    forecasts = await timed("weather_fetch", async_get_forecasts(weekend_keys))
+    return forecasts[weekend_keys[0]]
+
+async def update_latest_race_data(refresh=False):
+    # refresh rebuilds an already stored race and writes only the fields that changed
+    race_response = await timed("last_results_fetch", async_call_data_source(ERGAST_API_URI + "/current/last/results.json"))
+    race = race_response["MRData"]["RaceTable"]["Races"][0]
+    # Resolved in memory, an unknown circuit fails before any other request is made
+    track_info = find_track(race["Circuit"]["circuitId"], race["Circuit"]["circuitName"])
+
+    # Check if race data is stored in database
+    race_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {
+            "race.season": int(race["season"]),
+            "race.round": int(race["round"])
+      }
+    }
+    next_race_url = "{ergast}/{year}/{round}.json".format(ergast=ERGAST_API_URI, year=race["season"], round=int(race["round"]) + 1)
+
+    # Start every fetch at once so total time is bound by the slowest call
+    # Only the presence check decides whether the rest are needed
+    race_find_payload["limit"] = 1
+    if not refresh:
+        # Only existence matters, skip transferring the stored document
+        race_find_payload["projection"] = {"_id": 1}
+    stored_races_task = asyncio.create_task(timed("presence_check", async_mongodb_api_find(race_find_payload)))
+    next_race_task = asyncio.create_task(timed("next_race_fetch", async_call_data_source(next_race_url)))
+    fetch_tasks = [
+        asyncio.create_task(fetch_weekend_weather(race, next_race_task)),
+        asyncio.create_task(timed("driver_standings_fetch", async_call_data_source(ERGAST_API_URI + "/current/driverStandings.json"))),
+        asyncio.create_task(timed("constructor_standings_fetch", async_call_data_source(ERGAST_API_URI + "/current/constructorStandings.json"))),
+        next_race_task,
+    ]
+    try:
+        stored_races = await stored_races_task
+        if len(stored_races) != 0 and not refresh:
+            return {"status": UP_TO_DATE_STATUS}
+        weather_response, driver_standing_response, constructor_standing_response, next_race_response = await asyncio.gather(*fetch_tasks)
+    finally:
+        # Cancel anything still in flight and collect errors so none are left unretrieved
+        for task in fetch_tasks:
+            task.cancel()
+        await asyncio.gather(*fetch_tasks, return_exceptions=True)
+
+    # Highlights data
+    # Store black highlights link
+    # Will retrieve highlights in separate cron job call
+    highlights = race_classes.Highlights(
+        uri = ""
+    )
+
+    with span("race_info_build"):
+        race_info = build_race_info(race)
+    with span("track_build"):
+        track = build_track(track_info)
+    with span("weather_build"):
+        weather = build_weather(weather_response)
+    with span("results_build"):
+        race_results = build_results(race)
+    with span("standings_build"):
+        driver_standing = build_driver_standings(driver_standing_response)
+        constructor_standing = build_constructor_standings(constructor_standing_response)
+    with span("next_race_build"):
+        next_race = build_next_race(next_race_response)
 
     race_data = race_classes.RaceData(
         race = race_info,
@@ -276,6 +440,9 @@ def update_latest_race_data():
         nextRace = next_race
     )
 
+    if len(stored_races) != 0:
+        return await refresh_race_data(stored_races[0], race_data)
+
     # Store all race data
     race_insert_payload = {
         "dataSource": os.environ.get("MONGODB_CLUSTER"),
@@ -283,65 +450,44 @@ def update_latest_race_data():
         "collection": "races",
         "document": race_data.dict()
     }
-    insert_response = mongodb_api_insert_one(race_insert_payload)
+    insert_response = await timed("insert", async_mongodb_api_insert_one(race_insert_payload))
     if "insertedId" in insert_response:
+        await asyncio.to_thread(invalidate_stored_race, race_data.dict())
         return {"status": "Successfully updated with new race data"}
     else:
         raise HTTPException(status_code=400, detail="Updating race data failed for " + race["season"] + " - Round " + race["round"])
 
+async def refresh_race_data(stored_race, race_data):
+    # Highlights are found separately after ingestion, never overwrite them with the blank default
+    current_race = race_data.dict(exclude={"highlights"})
+    with span("diff"):
+        changes = diff_paths(stored_race, current_race)
+    if len(changes) == 0:
+        return {"status": UP_TO_DATE_STATUS}
 
-def find_latest_highlights_yt():
-    race_response = call_data_source("http://ergast.com/api/f1/current/last/results.json")
-    race = race_response["MRData"]["RaceTable"]["Races"][0]
-    # Check if highlights is stored in database
-    race_find_payload = {
+    race_update_payload = {
         "dataSource": os.environ.get("MONGODB_CLUSTER"),
         "database": os.environ.get("DB_NAME"),
         "collection": "races",
         "filter": {
-            "race.season": int(race["season"]),
-            "race.round": int(race["round"])
-      }
-    }
-    race_entry = mongodb_api_find_one(race_find_payload)
-    if race_entry["highlights"]["uri"] != "":
-        return {"status": "Highlights already exist for " + race["season"] + " - Round " + race["round"]}
-    
-    # Search for highlights
-    search = ChannelSearch('Race Highlights | ' + race["season"] + "", "UCB_qr75-ydFVKSF9Dmo6izg", 'en', 'US').result(mode = ResultMode.dict)
-    highlights_video_code = ""
-    for video in search["result"]:
-        if re.search("^Race Highlights \| " + race["season"] + " .* Grand Prix", video["title"]) and re.search("^.* (hour|minute)(|s) ago$", str(video["published"]).lower()):
-            highlights_video_code = str(video["uri"])
-            highlights_video_code = highlights_video_code.replace("/watch?v=", "")
-             # Store highlights
-            highlights_insert_payload = {
-                "dataSource": os.environ.get("MONGODB_CLUSTER"),
-                "database": os.environ.get("DB_NAME"),
-                "collection": "races",
-                "filter": {
-                    "_id": {
-                        "$oid": str(race_entry["_id"]) 
-                    } 
-                },
-                "update": {
-                    "$set": {
-                        "highlights.uri": "https://www.youtube.com/embed/" + highlights_video_code
-                    }
-                }
+            "_id": {
+                "$oid": str(stored_race["_id"])
             }
-            update_response = mongodb_api_update_one(highlights_insert_payload)
-            if "modifiedCount" in update_response and update_response["modifiedCount"] == 1:
-                # Successful update
-                # Clear cache so next call will contain highlights
-                global cache
-                cache = {}
-                return {"status": "Successfully added highlights for " + race["season"] + " - Round " + race["round"]}
-            else:
-                raise HTTPException(status_code=400, detail="Updating highlights data failed")
-    return {"status": "Couldn't find highlights for " + race["season"] + " - Round " + race["round"]}
+        },
+        "update": {
+            "$set": changes
+        }
+    }
+    update_response = await timed("update", async_mongodb_api_update_one(race_update_payload))
+    if "matchedCount" in update_response and update_response["matchedCount"] == 1:
+        # Only a real change drops the cached payloads
+        await asyncio.to_thread(invalidate_stored_race, race_data.dict())
+        return {"status": "Successfully refreshed race data", "changed": sorted(changes)}
+    raise HTTPException(status_code=400, detail="Refreshing race data failed for " + str(race_data.race.season) + " - Round " + str(race_data.race.round))
 
 def free_cache():
-    global cache
-    cache = {}
+    latest_race_cache.invalidate()
+    notify_latest_changed()
+    race_history_cache.invalidate()
+    next_weather_cache.invalidate()
     return {"status": "Cache cleared"}
\ No newline at end of file
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import struct
+
+import brotli
+from fastapi import Response
+
+LATEST_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+HISTORY_CACHE_CONTROL = "public, max-age=3600"
+
+
+class RenderedPayload:
+    # JSON body rendered once, with precompressed variants and a content hash for the ETag
+    __slots__ = ("body", "gzip", "brotli", "etag")
+
+    def __init__(self, body, gzip_body=None, brotli_body=None):
+        self.body = body
+        self.gzip = gzip_body if gzip_body is not None else gzip.compress(body, compresslevel=9, mtime=0)
+        self.brotli = brotli_body if brotli_body is not None else brotli.compress(body, mode=brotli.MODE_TEXT)
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+    @property
+    def size(self):
+        return len(self.body) + len(self.gzip) + len(self.brotli)
+
+# Shared cache backends store the variants too, so other workers skip compressing again
+def pack_payload(payload):
+    return struct.pack("!II", len(payload.body), len(payload.gzip)) + payload.body + payload.gzip + payload.brotli
+
+def unpack_payload(data):
+    body_size, gzip_size = struct.unpack_from("!II", data)
+    body_end = 8 + body_size
+    gzip_end = body_end + gzip_size
+    return RenderedPayload(data[8:body_end], data[body_end:gzip_end], data[gzip_end:])
+
+def render_model(model):
+    return RenderedPayload(model.json().encode("utf-8"))
+
+def render_models(models):
+    return RenderedPayload(("[" + ",".join(model.json() for model in models) + "]").encode("utf-8"))
+
+def _accepted_encodings(header):
+    encodings = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip().replace(" ", "")
+        if quality in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+def _encoded_etag(etag, encoding):
+    # Each content-coding is a separate representation and gets its own strong validator, e.g. "<hash>-br"
+    return etag if encoding is None else etag[:-1] + "-" + encoding + '"'
+
+def _etag_matches(header, etag):
+    # Any coding of the same body matches, a client may revalidate a gzip copy with a br request
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*" or candidate == etag or (candidate.startswith(etag[:-1] + "-") and candidate.endswith('"')):
+            return True
+    return False
+
+def payload_response(payload, request, cache_control=LATEST_CACHE_CONTROL):
+    accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+    if "br" in accepted:
+        encoding, body = "br", payload.brotli
+    elif "gzip" in accepted:
+        encoding, body = "gzip", payload.gzip
+    else:
+        encoding, body = None, payload.body
+    headers = {
+        "ETag": _encoded_etag(payload.etag, encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding"
+    }
+    if _etag_matches(request.headers.get("if-none-match", ""), payload.etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from . import highlights, race_data
+
+from .database import async_mongodb_api_find
+
+from .shared_cache import lease_backend
+
+RACE_SCHEDULER = os.environ.get("RACE_SCHEDULER", "false").lower() == "true"
+# Ingestion starts this long after the scheduled race start, roughly when the race has ended
+INGEST_DELAY = timedelta(hours=float(os.environ.get("SCHEDULER_INGEST_DELAY_HOURS", 2)))
+# Results are retried for this long before the expected race is given up on, e.g. when it was cancelled
+INGEST_WINDOW = timedelta(hours=float(os.environ.get("SCHEDULER_INGEST_WINDOW_HOURS", 72)))
+INGEST_RETRY_INTERVAL = float(os.environ.get("SCHEDULER_RETRY_INTERVAL", 600))
+SCHEDULER_IDLE_INTERVAL = float(os.environ.get("SCHEDULER_IDLE_INTERVAL", 86400))
+# Seconds the worker running the scheduler holds its lease, another worker takes over this long after it stops renewing
+SCHEDULER_LEASE_TTL = float(os.environ.get("SCHEDULER_LEASE_TTL", 60))
+SCHEDULER_LEASE_KEY = "simplef1:lease:scheduler"
+
+DATETIME_UTC_FORMAT = "%Y-%m-%d %H:%M:%S GMT"
+
+logger = logging.getLogger(__name__)
+scheduler_task = None
+leader_task = None
+
+
+async def find_next_race_start():
+    # Start of the race after the latest stored one, None at the end of the season
+    latest_race_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "races",
+        "filter": {},
+        "sort": {
+            "race.season": -1,
+            "race.round": -1
+        },
+        "limit": 1,
+        "projection": {
+            "nextRace": 1
+        }
+    }
+    races = await async_mongodb_api_find(latest_race_find_payload)
+    if len(races) == 0 or races[0]["nextRace"]["dateTimeUtc"] == "-":
+        return None
+    return datetime.strptime(races[0]["nextRace"]["dateTimeUtc"], DATETIME_UTC_FORMAT).replace(tzinfo=timezone.utc)
+
+async def ingest_race():
+    # True once a race that was not stored before has been ingested
+    try:
+        result = await race_data.update_latest_race_data()
+    except Exception:
+        logger.exception("Scheduled race ingestion failed")
+        return False
+    if result["status"] == race_data.UP_TO_DATE_STATUS:
+        return False
+    # Rebuild the latest payload before the first visitor asks for it and start looking for highlights
+    await asyncio.to_thread(race_data.get_latest_race_data)
+    await asyncio.to_thread(race_data.get_next_race_weather)
+    highlights.wake_worker()
+    return True
+
+async def race_scheduler():
+    while True:
+        try:
+            next_race_start = await find_next_race_start()
+        except Exception:
+            logger.exception("Reading the next race failed")
+            await asyncio.sleep(INGEST_RETRY_INTERVAL)
+            continue
+
+        now = datetime.now(timezone.utc)
+        if next_race_start is None or now > next_race_start + INGEST_DELAY + INGEST_WINDOW:
+            # Nothing scheduled, or results never came for the expected race, check again later
+            if not await ingest_race():
+                await asyncio.sleep(SCHEDULER_IDLE_INTERVAL)
+            continue
+
+        ingest_at = next_race_start + INGEST_DELAY
+        if now < ingest_at:
+            await asyncio.sleep((ingest_at - now).total_seconds())
+        # Ergast publishes results some time after the race, keep trying until they are stored
+        while not await ingest_race():
+            if datetime.now(timezone.utc) > ingest_at + INGEST_WINDOW:
+                break
+            await asyncio.sleep(INGEST_RETRY_INTERVAL)
+
+def start_scheduler():
+    global scheduler_task
+    if scheduler_task is None:
+        scheduler_task = asyncio.create_task(race_scheduler())
+
+async def stop_scheduler():
+    global scheduler_task
+    if scheduler_task is not None:
+        scheduler_task.cancel()
+        await asyncio.gather(scheduler_task, return_exceptions=True)
+        scheduler_task = None
+
+async def leader(run_scheduler):
+    # Only the worker holding the lease runs the scheduler and the highlights worker, the others wait to take over
+    backend = lease_backend()
+    token = uuid.uuid4().hex
+    while True:
+        try:
+            leading = await asyncio.to_thread(backend.acquire, SCHEDULER_LEASE_KEY, token, SCHEDULER_LEASE_TTL)
+        except Exception:
+            logger.exception("Acquiring the scheduler lease failed")
+            leading = False
+        if leading:
+            highlights.start_worker()
+            if run_scheduler:
+                start_scheduler()
+            try:
+                while True:
+                    await asyncio.sleep(SCHEDULER_LEASE_TTL / 3)
+                    try:
+                        if not await asyncio.to_thread(backend.renew, SCHEDULER_LEASE_KEY, token, SCHEDULER_LEASE_TTL):
+                            break
+                    except Exception:
+                        logger.exception("Renewing the scheduler lease failed")
+                        break
+                # Another worker may already have taken over
+                logger.warning("Scheduler lease lost, stopping the background workers")
+            finally:
+                await stop_scheduler()
+                await highlights.stop_worker()
+                try:
+                    await asyncio.to_thread(backend.release, SCHEDULER_LEASE_KEY, token)
+                except Exception:
+                    logger.exception("Releasing the scheduler lease failed")
+        await asyncio.sleep(SCHEDULER_LEASE_TTL / 3)
+
+def start_leader(run_scheduler):
+    global leader_task
+    if leader_task is None:
+        leader_task = asyncio.create_task(leader(run_scheduler))
+
+async def stop_leader():
+    global leader_task
+    if leader_task is not None:
+        leader_task.cancel()
+        await asyncio.gather(leader_task, return_exceptions=True)
+        leader_task = None
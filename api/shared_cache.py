@@ -0,0 +1,390 @@
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+
+# local - every worker keeps its own caches (default)
+# memory - in-process backend, a stand-in with the shared semantics for tests
+# sqlite - SQLite file shared by the workers on one host
+# redis - Redis or a compatible server shared by every host, needs the redis package
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "local")
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "simplef1_cache.sqlite"))
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+# Seconds between checks for invalidations made by other workers
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL", 1))
+# Invalidation events kept per cache, workers further behind than this drop everything
+CACHE_EVENT_LIMIT = 1000
+# Longest a worker holds the lease to load a missing entry, other workers wait for its value until then
+CACHE_LOCK_TIMEOUT = float(os.environ.get("CACHE_LOCK_TIMEOUT", 10))
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Backends store bytes under string keys and keep a numbered invalidation log per cache.
+#   get(key) -> bytes or None
+#   set(key, value, ttl) - ttl in seconds, None to keep until deleted
+#   delete(key), delete_prefix(prefix)
+#   publish(channel, message) -> seq
+#   events(channel, after) -> [(seq, message)] in order, None when events after `after` were trimmed
+#   last_event(channel) -> seq, 0 before the first event
+#   acquire(key, token, ttl) -> True when the lease was free or expired and is now held with token
+#   renew(key, token, ttl) -> True when token still holds the lease, which now runs ttl from now
+#   release(key, token) - frees the lease if token still holds it
+
+
+class MemoryBackend:
+    def __init__(self):
+        self._values = {}
+        self._events = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._values[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._values[key] = (value, time.time() + ttl if ttl is not None else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._values if key.startswith(prefix)]:
+                del self._values[key]
+
+    def publish(self, channel, message):
+        with self._lock:
+            events = self._events.setdefault(channel, [])
+            seq = events[-1][0] + 1 if events else 1
+            events.append((seq, message))
+            del events[:-CACHE_EVENT_LIMIT]
+            return seq
+
+    def events(self, channel, after):
+        with self._lock:
+            events = self._events.get(channel, [])
+            if events and after < events[0][0] - 1:
+                return None
+            return [event for event in events if event[0] > after]
+
+    def last_event(self, channel):
+        with self._lock:
+            events = self._events.get(channel)
+            return events[-1][0] if events else 0
+
+    def acquire(self, key, token, ttl):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[1] > time.time():
+                return False
+            self._leases[key] = (token, time.time() + ttl)
+            return True
+
+    def renew(self, key, token, ttl):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease[0] != token or lease[1] <= time.time():
+                return False
+            self._leases[key] = (token, time.time() + ttl)
+            return True
+
+    def release(self, key, token):
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] == token:
+                del self._leases[key]
+
+
+class SqliteBackend:
+    def __init__(self, path=CACHE_SQLITE_PATH):
+        self.path = path
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            import sqlite3
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            # Readers in other workers are not blocked by a write
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS events (seq INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, message TEXT NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS events_channel ON events (channel, seq)")
+            connection.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._connection = connection
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM entries WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())).fetchone()
+        return bytes(row[0]) if row is not None else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._connect().execute("INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                                    (key, value, time.time() + ttl if ttl is not None else None))
+
+    def delete(self, key):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            self._connect().execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def publish(self, channel, message):
+        # Event numbers are shared by every channel, only their order matters
+        with self._lock:
+            connection = self._connect()
+            seq = connection.execute("INSERT INTO events (channel, message) VALUES (?, ?)", (channel, message)).lastrowid
+            connection.execute("DELETE FROM events WHERE channel = ? AND seq <= ?", (channel, seq - CACHE_EVENT_LIMIT))
+        return seq
+
+    def events(self, channel, after):
+        with self._lock:
+            connection = self._connect()
+            last = connection.execute("SELECT max(seq) FROM events WHERE channel = ?", (channel,)).fetchone()[0]
+            # Publishing keeps the events numbered within CACHE_EVENT_LIMIT of the newest one
+            if last is not None and after < last - CACHE_EVENT_LIMIT:
+                return None
+            return connection.execute("SELECT seq, message FROM events WHERE channel = ? AND seq > ? ORDER BY seq", (channel, after)).fetchall()
+
+    def last_event(self, channel):
+        with self._lock:
+            seq = self._connect().execute("SELECT max(seq) FROM events WHERE channel = ?", (channel,)).fetchone()[0]
+        return seq or 0
+
+    def acquire(self, key, token, ttl):
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM leases WHERE key = ? AND expires_at <= ?", (key, now))
+            # Only one worker's insert lands while the lease is held
+            return connection.execute("INSERT OR IGNORE INTO leases (key, token, expires_at) VALUES (?, ?, ?)", (key, token, now + ttl)).rowcount == 1
+
+    def renew(self, key, token, ttl):
+        now = time.time()
+        with self._lock:
+            return self._connect().execute("UPDATE leases SET expires_at = ? WHERE key = ? AND token = ? AND expires_at > ?",
+                                           (now + ttl, key, token, now)).rowcount == 1
+
+    def release(self, key, token):
+        with self._lock:
+            self._connect().execute("DELETE FROM leases WHERE key = ? AND token = ?", (key, token))
+
+
+class RedisBackend:
+    def __init__(self, url=CACHE_REDIS_URL):
+        # Only deployments using Redis need the client installed
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            self._client.set(key, value)
+        else:
+            self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def delete_prefix(self, prefix):
+        keys = list(self._client.scan_iter(match=prefix.replace("*", "\\*") + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def publish(self, channel, message):
+        seq = self._client.incr(channel + ":seq")
+        pipeline = self._client.pipeline()
+        pipeline.zadd(channel + ":events", {str(seq) + ":" + message: seq})
+        pipeline.zremrangebyscore(channel + ":events", 0, seq - CACHE_EVENT_LIMIT)
+        pipeline.execute()
+        return seq
+
+    def events(self, channel, after):
+        members = self._client.zrangebyscore(channel + ":events", "(" + str(after), "+inf", withscores=True)
+        events = []
+        for member, seq in members:
+            events.append((int(seq), member.decode("utf-8").partition(":")[2]))
+        if events and events[0][0] > after + 1:
+            return None
+        return events
+
+    def last_event(self, channel):
+        seq = self._client.get(channel + ":seq")
+        return int(seq) if seq is not None else 0
+
+    def acquire(self, key, token, ttl):
+        return bool(self._client.set(key, token, nx=True, px=max(1, int(ttl * 1000))))
+
+    def renew(self, key, token, ttl):
+        return bool(self._client.eval("if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0",
+                                      1, key, token, max(1, int(ttl * 1000))))
+
+    def release(self, key, token):
+        # Compare and delete in one step, an expired lease may already belong to another worker
+        self._client.eval("if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0", 1, key, token)
+
+
+def create_backend(name=CACHE_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sqlite":
+        return SqliteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError("Unknown CACHE_BACKEND " + name)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def cache_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+    return _backend
+
+def lease_backend():
+    # Leases need a backend every worker sees, with local caches the workers of one host share the SQLite file
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend("sqlite" if CACHE_BACKEND == "local" else CACHE_BACKEND)
+    return _backend
+
+
+class SharedCache:
+    # Keeps a per-process TTLCache or LRUCache in front of a shared backend.
+    # Misses are filled from the backend before calling the loader, so one worker's load serves every worker.
+    # A lease in the backend lets one worker run the loader while the others wait for the value it stores.
+    # Entries carry the time they were loaded, local copies expire by that time rather than when they were read.
+    # Invalidations are logged in the backend and replayed by the other workers within CACHE_SYNC_INTERVAL.
+
+    def __init__(self, name, local, backend, encode, decode, ttl=None):
+        self.name = name
+        self.local = local
+        self.backend = backend
+        self.encode = encode
+        self.decode = decode
+        self.ttl = ttl
+        self._seq = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"shared_hits": 0, "shared_misses": 0, "shared_lock_waits": 0, "shared_invalidations": 0}
+        # Entries, leases and the invalidation log live under separate prefixes so clearing entries keeps the others
+        self._prefix = "simplef1:entry:" + name + ":"
+        self._lease_prefix = "simplef1:lease:" + name + ":"
+        self._channel = "simplef1:events:" + name
+
+    def _key(self, key):
+        # Keys are strings so they can be logged as invalidation events
+        return self._prefix + key
+
+    def _sync(self):
+        now = time.monotonic()
+        if now - self._synced_at < CACHE_SYNC_INTERVAL:
+            return
+        with self._lock:
+            if now - self._synced_at < CACHE_SYNC_INTERVAL:
+                return
+            self._synced_at = now
+            if self._seq is None:
+                self._seq = self.backend.last_event(self._channel)
+                return
+            events = self.backend.events(self._channel, self._seq)
+            if events is None:
+                # Too far behind to know what changed
+                self.local.invalidate()
+                self._seq = self.backend.last_event(self._channel)
+                self._stats["shared_invalidations"] += 1
+                return
+            for seq, message in events:
+                self.local.invalidate(None if message == "*" else message)
+                self._seq = seq
+                self._stats["shared_invalidations"] += 1
+
+    def _stored(self, key):
+        # (value, age) from the backend, None on a miss
+        data = self.backend.get(self._key(key))
+        if data is None:
+            return None
+        loaded_at = struct.unpack_from("!d", data)[0]
+        return self.decode(data[8:]), max(0.0, time.time() - loaded_at)
+
+    def _load(self, key, loader):
+        stored = self._stored(key)
+        if stored is not None:
+            with self._lock:
+                self._stats["shared_hits"] += 1
+            return stored
+        with self._lock:
+            self._stats["shared_misses"] += 1
+        lease = self._lease_prefix + key
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + CACHE_LOCK_TIMEOUT
+        while not self.backend.acquire(lease, token, CACHE_LOCK_TIMEOUT):
+            # Another worker is loading, its value arrives in the backend
+            with self._lock:
+                self._stats["shared_lock_waits"] += 1
+            time.sleep(CACHE_LOCK_POLL_INTERVAL)
+            stored = self._stored(key)
+            if stored is not None:
+                return stored
+            if time.monotonic() > deadline:
+                # Lease holder is stuck, load without it
+                token = None
+                break
+        try:
+            seq = self.backend.last_event(self._channel)
+            loaded_at = time.time()
+            value = loader()
+            # A value loaded across an invalidation may be outdated, keep it out of the backend
+            if self.backend.last_event(self._channel) == seq:
+                self.backend.set(self._key(key), struct.pack("!d", loaded_at) + self.encode(value), self.ttl)
+        finally:
+            if token is not None:
+                self.backend.release(lease, token)
+        return value, time.time() - loaded_at
+
+    def get(self, key, loader):
+        self._sync()
+        return self.local.get_aged(key, lambda: self._load(key, loader))
+
+    def invalidate(self, key=None):
+        if key is None:
+            self.backend.delete_prefix(self._prefix)
+        else:
+            self.backend.delete(self._key(key))
+        seq = self.backend.publish(self._channel, "*" if key is None else key)
+        self.local.invalidate(key)
+        with self._lock:
+            # Own event is already applied
+            if self._seq is not None and self._seq == seq - 1:
+                self._seq = seq
+
+    def stats(self):
+        stats = self.local.stats()
+        with self._lock:
+            stats.update(self._stats)
+        return stats
+
+
+def shared_cache(name, local, encode, decode, ttl=None):
+    # Local cache as is unless CACHE_BACKEND selects a shared backend
+    if CACHE_BACKEND == "local":
+        return local
+    return SharedCache(name, local, cache_backend(), encode, decode, ttl)
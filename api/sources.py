@@ -0,0 +1,8 @@
+import os
+
+# Upstream base URIs, overridable to point at local stand-ins
+ERGAST_API_URI = os.environ.get("ERGAST_API_URI", "http://ergast.com/api/f1")
+OPEN_METEO_API_URI = os.environ.get("OPEN_METEO_API_URI", "https://api.open-meteo.com/v1")
+OPEN_METEO_ARCHIVE_API_URI = os.environ.get("OPEN_METEO_ARCHIVE_API_URI", "https://archive-api.open-meteo.com/v1")
+# When set, channel searches are made against this JSON endpoint instead of YouTube
+YOUTUBE_SEARCH_URI = os.environ.get("YOUTUBE_SEARCH_URI")
@@ -0,0 +1,40 @@
+import csv
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+CIRCUIT_TIMEZONES = Path(__file__).parent /"./../data/circuit_timezones.csv"
+# Ergast coordinates for a circuit drift slightly between seasons, match within ~10km
+MATCH_TOLERANCE = 0.1
+
+_index = None
+_polygon_finder = None
+_lock = threading.Lock()
+
+def _load_index():
+    global _index
+    if _index is None:
+        with open(CIRCUIT_TIMEZONES, newline="") as file:
+            _index = tuple((float(row["lat"]), float(row["long"]), row["timezone"]) for row in csv.DictReader(file))
+    return _index
+
+def _polygon_lookup(lat, long):
+    # Only unknown circuits pay for loading the world timezone polygons
+    global _polygon_finder
+    with _lock:
+        if _polygon_finder is None:
+            from tzwhere import tzwhere
+            _polygon_finder = tzwhere.tzwhere()
+    return _polygon_finder.tzNameAt(lat, long)
+
+@lru_cache(maxsize=256)
+def find_timezone(lat, long):
+    lat, long = float(lat), float(long)
+    closest = None
+    for entry_lat, entry_long, timezone in _load_index():
+        distance = max(abs(entry_lat - lat), abs(entry_long - long))
+        if distance <= MATCH_TOLERANCE and (closest is None or distance < closest[0]):
+            closest = (distance, timezone)
+    if closest is not None:
+        return closest[1]
+    return _polygon_lookup(lat, long)
@@ -0,0 +1,146 @@
+import asyncio
+import csv
+import logging
+import os
+import threading
+import unicodedata
+from collections import namedtuple
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from .database import async_mongodb_api_find, mongodb_client
+
+TRACK_INFORMATION = Path(__file__).parent /"./../data/tracks.csv"
+TRACKS_REFRESH = os.environ.get("TRACKS_REFRESH", "false").lower() == "true"
+TRACK_FIELDS = ("name", "mapUri", "turns", "length", "laps", "distance", "drsDetectionZones", "drsZones")
+
+# Track metadata resolved in memory by Ergast circuitId, loaded once from the bundled CSV, resolution never needs the network.
+# With TRACKS_REFRESH=true the tracks collection refreshes entries at startup, the bundled rows serve until it arrives.
+# CLI: python -m api.tracks writes the refreshed entries back to data/tracks.csv
+
+# One immutable tuple per circuit, shared by every key that resolves to it
+TrackInfo = namedtuple("TrackInfo", TRACK_FIELDS)
+
+# circuitId -> (aliases, TrackInfo)
+_tracks = None
+# circuitId and normalised names -> TrackInfo
+_index = None
+_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+refresh_task = None
+
+
+def normalise_name(name):
+    # Case, accents and spacing differ between Ergast and the tracks collection
+    decomposed = unicodedata.normalize("NFKD", name)
+    return " ".join("".join(char for char in decomposed if not unicodedata.combining(char)).lower().split())
+
+def _track_info(row):
+    return TrackInfo(
+        name = row["name"],
+        mapUri = row["mapUri"] or "",
+        turns = int(row["turns"]),
+        length = float(row["length"]),
+        laps = int(row["laps"]),
+        distance = float(row["distance"]),
+        drsDetectionZones = int(row["drsDetectionZones"]),
+        drsZones = int(row["drsZones"])
+    )
+
+def _build_index(tracks):
+    index = {}
+    for circuit_id, (aliases, track) in tracks.items():
+        for name in (track.name,) + aliases:
+            index[normalise_name(name)] = track
+        index[circuit_id] = track
+    return index
+
+def _load_tracks():
+    global _tracks, _index
+    with _lock:
+        if _tracks is None:
+            tracks = {}
+            with open(TRACK_INFORMATION, newline="", encoding="utf-8") as file:
+                for row in csv.DictReader(file):
+                    aliases = tuple(alias for alias in row["aliases"].split("|") if alias)
+                    tracks[row["circuitId"]] = (aliases, _track_info(row))
+            _index = _build_index(tracks)
+            _tracks = tracks
+    return _index
+
+def find_track(circuit_id, circuit_name=""):
+    # Falls back to the circuit name and its aliases for circuits with a new Ergast id
+    index = _load_tracks()
+    track = index.get(circuit_id) or index.get(normalise_name(circuit_name))
+    if track is None:
+        raise HTTPException(status_code=500, detail="No track information for " + circuit_id + " (" + circuit_name + "), add it to data/tracks.csv")
+    return track
+
+def merge_tracks(documents):
+    # Each document replaces the bundled entry it names, unknown circuits need a row in the CSV first
+    global _tracks, _index
+    _load_tracks()
+    with _lock:
+        tracks = dict(_tracks)
+        circuit_ids = {normalise_name(name): circuit_id for circuit_id, (aliases, track) in tracks.items() for name in (track.name,) + aliases}
+        merged = 0
+        for document in documents:
+            circuit_id = circuit_ids.get(normalise_name(document["name"]))
+            if circuit_id is None:
+                logger.warning("Track %s has no circuitId in data/tracks.csv, skipped", document["name"])
+                continue
+            aliases, bundled = tracks[circuit_id]
+            track = _track_info(document)
+            if normalise_name(bundled.name) != normalise_name(track.name):
+                # Keep matching the Ergast spelling
+                aliases = aliases + (bundled.name,)
+            tracks[circuit_id] = (aliases, track)
+            merged += 1
+        _index = _build_index(tracks)
+        _tracks = tracks
+    return merged
+
+async def refresh_tracks():
+    tracks_find_payload = {
+        "dataSource": os.environ.get("MONGODB_CLUSTER"),
+        "database": os.environ.get("DB_NAME"),
+        "collection": "tracks",
+        "filter": {}
+    }
+    return merge_tracks(await async_mongodb_api_find(tracks_find_payload))
+
+async def _refresh():
+    try:
+        return await refresh_tracks()
+    except Exception:
+        # The bundled tracks keep working without the database
+        logger.exception("Refreshing tracks failed")
+        return 0
+
+def start_refresh():
+    # Bundled tracks serve until the database copy arrives
+    global refresh_task
+    if refresh_task is None:
+        refresh_task = asyncio.create_task(_refresh())
+
+def export_tracks(path=TRACK_INFORMATION):
+    _load_tracks()
+    with _lock:
+        tracks = dict(_tracks)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow(("circuitId", "name", "aliases") + TRACK_FIELDS[1:])
+        for circuit_id, (aliases, track) in tracks.items():
+            writer.writerow((circuit_id, track.name, "|".join(aliases)) + track[1:])
+
+
+async def main():
+    try:
+        print("Refreshed " + str(await refresh_tracks()) + " tracks")
+        export_tracks()
+    finally:
+        await mongodb_client.aclose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
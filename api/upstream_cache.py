@@ -0,0 +1,84 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date
+
+from fastapi import HTTPException
+
+from .sources import ERGAST_API_URI, OPEN_METEO_API_URI, OPEN_METEO_ARCHIVE_API_URI
+
+# off - always call upstream
+# record - serve fresh stored responses, store new ones
+# replay - only serve stored responses regardless of age, never call upstream
+UPSTREAM_CACHE_MODE = os.environ.get("UPSTREAM_CACHE_MODE", "record")
+UPSTREAM_CACHE_PATH = os.environ.get("UPSTREAM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "simplef1_upstream_cache.sqlite"))
+
+# Seconds a stored response is fresh for, per upstream source
+UPSTREAM_CACHE_TTLS = {
+    ERGAST_API_URI: 5 * 60,
+    OPEN_METEO_API_URI: 60 * 60,
+    OPEN_METEO_ARCHIVE_API_URI: 30 * 24 * 60 * 60,
+}
+# Ergast data for a season that has ended no longer changes
+FINISHED_SEASON_TTL = 30 * 24 * 60 * 60
+ERGAST_SEASON_PATH = re.compile(r"^/(\d{4})[/.]")
+
+
+def upstream_ttl(api_url):
+    if api_url.startswith(ERGAST_API_URI + "/"):
+        season = ERGAST_SEASON_PATH.match(api_url[len(ERGAST_API_URI):])
+        if season is not None and int(season[1]) < date.today().year:
+            return FINISHED_SEASON_TTL
+    for source_uri, ttl in UPSTREAM_CACHE_TTLS.items():
+        if api_url.startswith(source_uri + "/"):
+            return ttl
+    return 0
+
+
+class UpstreamCache:
+    # SQLite-backed store of raw upstream response bodies keyed by URL
+
+    def __init__(self, path=UPSTREAM_CACHE_PATH, mode=UPSTREAM_CACHE_MODE):
+        self.path = path
+        self.mode = mode
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None:
+            # Imported on the first upstream call, requests served from the database never need it
+            import sqlite3
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, body TEXT NOT NULL, stored_at REAL NOT NULL)")
+        return self._connection
+
+    def lookup(self, api_url):
+        # Decoded stored response, or None when upstream should be called
+        if self.mode == "off":
+            return None
+        with self._lock:
+            row = self._connect().execute("SELECT body, stored_at FROM responses WHERE url = ?", (api_url,)).fetchone()
+        if self.mode == "replay":
+            if row is None:
+                raise HTTPException(status_code=503, detail="No recorded response for " + api_url)
+            return json.loads(row[0])
+        if row is None or time.time() - row[1] >= upstream_ttl(api_url):
+            return None
+        return json.loads(row[0])
+
+    def store(self, api_url, body):
+        if self.mode != "record" or upstream_ttl(api_url) <= 0:
+            return
+        with self._lock:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO responses (url, body, stored_at) VALUES (?, ?, ?)", (api_url, body, time.time()))
+            connection.commit()
+
+    def clear(self):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM responses")
+            connection.commit()
@@ -1,9 +1,47 @@
-import requests
+import asyncio
+import os
+from urllib.parse import urlsplit
+
 from fastapi import HTTPException
 
+from .client import ApiClient
+
+from .upstream_cache import UpstreamCache
+
+from .metrics import upstream_cache_events
+
+from .sources import ERGAST_API_URI
+
+# Ergast allows bursts of 4 requests per second and 200 requests per hour
+ERGAST_REQUESTS_PER_SECOND = int(os.environ.get("ERGAST_REQUESTS_PER_SECOND", 4))
+ERGAST_REQUESTS_PER_HOUR = int(os.environ.get("ERGAST_REQUESTS_PER_HOUR", 200))
+
+# Shared pooled client so upstream calls reuse connections across requests
+data_source_client = ApiClient(rate_limits={
+    urlsplit(ERGAST_API_URI).netloc: ((ERGAST_REQUESTS_PER_SECOND, 1), (ERGAST_REQUESTS_PER_HOUR, 60 * 60))
+})
+upstream_cache = UpstreamCache()
+
 def call_data_source(api_url):
-    response = requests.get(api_url)
-    # print("response" + response)
+    cached = upstream_cache.lookup(api_url)
+    if cached is not None:
+        upstream_cache_events.inc(result="hit")
+        return cached
+    upstream_cache_events.inc(result="miss")
+    response = data_source_client.request("GET", api_url)
+    if response.status_code != 200:
+        raise HTTPException(status_code=500, detail="Upstream error")
+    upstream_cache.store(api_url, response.text)
+    return response.json()
+
+async def async_call_data_source(api_url):
+    cached = await asyncio.to_thread(upstream_cache.lookup, api_url)
+    if cached is not None:
+        upstream_cache_events.inc(result="hit")
+        return cached
+    upstream_cache_events.inc(result="miss")
+    response = await data_source_client.arequest("GET", api_url)
     if response.status_code != 200:
         raise HTTPException(status_code=500, detail="Upstream error")
+    await asyncio.to_thread(upstream_cache.store, api_url, response.text)
     return response.json()
@@ -0,0 +1,143 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .sources import OPEN_METEO_API_URI
+
+from .utils import call_data_source, async_call_data_source
+
+from .metrics import register_cache
+
+WEATHER_DAILY_FIELDS = ("weathercode", "temperature_2m_max", "temperature_2m_min", "precipitation_sum")
+# Open-Meteo forecasts reach this many days ahead, later weekends are not requested
+FORECAST_HORIZON_DAYS = 16
+# Forecasts for the next couple of days change with every hourly model run, later days less often
+NEAR_FORECAST_DAYS = 2
+NEAR_FORECAST_TTL = 60 * 60
+FAR_FORECAST_TTL = 6 * 60 * 60
+# Days that have passed only get small corrections
+PAST_WEATHER_TTL = 7 * 24 * 60 * 60
+# Two decimals is ~1km, finer than the forecast grid, so a circuit keeps one key across seasons
+COORDINATE_DECIMALS = 2
+
+# Daily weather keyed by (lat, long, start_date, end_date) of a race weekend.
+# Every missing weekend is fetched in one multi-location request.
+
+
+class ForecastCache:
+    # Thread-safe cache where each entry has its own expiry
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._stats["hits"] += 1
+                return entry[0]
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._stats["invalidations"] += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+forecast_cache = ForecastCache()
+register_cache("forecast", forecast_cache)
+
+
+def weekend_key(race):
+    # Qualifying day to race day at the circuit
+    race_date = datetime.strptime(race["date"], "%Y-%m-%d").date()
+    location = race["Circuit"]["Location"]
+    return (round(float(location["lat"]), COORDINATE_DECIMALS), round(float(location["long"]), COORDINATE_DECIMALS), race_date - timedelta(days=1), race_date)
+
+def forecast_ttl(key, today):
+    start_date, end_date = key[2], key[3]
+    if end_date < today:
+        return PAST_WEATHER_TTL
+    if (start_date - today).days <= NEAR_FORECAST_DAYS:
+        return NEAR_FORECAST_TTL
+    return FAR_FORECAST_TTL
+
+def is_forecast_available(key, today):
+    return key[3] < today + timedelta(days=FORECAST_HORIZON_DAYS)
+
+def weather_url(api_url, keys):
+    # One request for every location, spanning the earliest to the latest day of all of them
+    return "{api_url}?latitude={lat}&longitude={long}&daily={daily}&timezone=auto&start_date={start_date}&end_date={end_date}".format(
+        api_url=api_url,
+        lat=",".join(str(key[0]) for key in keys),
+        long=",".join(str(key[1]) for key in keys),
+        daily=",".join(WEATHER_DAILY_FIELDS),
+        start_date=min(key[2] for key in keys).strftime("%Y-%m-%d"),
+        end_date=max(key[3] for key in keys).strftime("%Y-%m-%d")
+    )
+
+def split_locations(keys, weather_response):
+    # Cuts each location of a weather_url response down to its own days
+    # A single location is returned as an object rather than a list
+    if isinstance(weather_response, dict):
+        weather_response = [weather_response]
+    start_date = min(key[2] for key in keys)
+    weather = {}
+    for key, location in zip(keys, weather_response):
+        start = (key[2] - start_date).days
+        end = start + (key[3] - key[2]).days + 1
+        weather[key] = {
+            "daily": {field: location["daily"][field][start:end] for field in WEATHER_DAILY_FIELDS}
+        }
+    return weather
+
+def _cached_forecasts(keys, today):
+    # Forecasts already known, None for weekends past the horizon, and the keys still to fetch
+    forecasts = {}
+    missing = []
+    for key in dict.fromkeys(keys):
+        if not is_forecast_available(key, today):
+            forecasts[key] = None
+            continue
+        forecast = forecast_cache.lookup(key)
+        if forecast is None:
+            missing.append(key)
+        else:
+            forecasts[key] = forecast
+    return forecasts, missing
+
+def _store_forecasts(forecasts, missing, weather_response, today):
+    for key, forecast in split_locations(missing, weather_response).items():
+        forecast_cache.store(key, forecast, forecast_ttl(key, today))
+        forecasts[key] = forecast
+    return forecasts
+
+def get_forecasts(keys):
+    today = datetime.utcnow().date()
+    forecasts, missing = _cached_forecasts(keys, today)
+    if len(missing) == 0:
+        return forecasts
+    return _store_forecasts(forecasts, missing, call_data_source(weather_url(OPEN_METEO_API_URI + "/forecast", missing)), today)
+
+async def async_get_forecasts(keys):
+    today = datetime.utcnow().date()
+    forecasts, missing = _cached_forecasts(keys, today)
+    if len(missing) == 0:
+        return forecasts
+    return _store_forecasts(forecasts, missing, await async_call_data_source(weather_url(OPEN_METEO_API_URI + "/forecast", missing)), today)
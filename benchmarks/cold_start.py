@@ -0,0 +1,153 @@
+# Cold start of the app as a serverless function sees it: importing main, startup, then the first responses.
+# Every run is a fresh interpreter against local fake upstreams, one more run with -X importtime gives the
+# per-module breakdown. Run from the repository root:
+#   python -m benchmarks.cold_start --runs 10 --budget-ms 800
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from .fake_upstreams import start_upstreams
+from .service import RESULTS_DIR, configure_environment, git_revision
+
+ROOT = Path(__file__).parent.parent
+REPO_PACKAGES = ("main", "api", "routers", "schemas")
+
+# requests is only needed by the test client, import it before timing so it is not counted against the app
+HARNESS = """
+import json, time
+import requests
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(main.app)
+client_ready = time.perf_counter()
+with client:
+    started = time.perf_counter()
+    timings = {{}}
+    for path in {paths!r}:
+        request_start = time.perf_counter()
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code, response.text[:200])
+        timings[path] = time.perf_counter() - request_start
+    first_responses = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "startup_ms": (started - client_ready) * 1000,
+    "responses_ms": {{path: seconds * 1000 for path, seconds in timings.items()}},
+    # Test client setup is left out of the total
+    "total_ms": (first_responses - start - (client_ready - imported)) * 1000
+}}))
+"""
+
+PATHS = ("/status", "/api/latest")
+
+
+def seed_race():
+    # One stored race so /api/latest has something to load, ingested in this process and not timed
+    sys.path.insert(0, str(ROOT))
+    from fastapi.testclient import TestClient
+    import main as app_module
+    with TestClient(app_module.app) as client:
+        response = client.get("/api/update")
+        if response.status_code != 200:
+            raise RuntimeError("Seeding failed: " + response.text[:200])
+
+def run_harness(extra_arguments=()):
+    return subprocess.run([sys.executable, "-W", "ignore", *extra_arguments, "-c", HARNESS.format(paths=PATHS)],
+                          cwd=ROOT, capture_output=True, text=True, check=True)
+
+def import_breakdown(stderr, top):
+    # -X importtime lines: "import time: self [us] | cumulative | imported package"
+    # A module is listed after everything it imported, nesting shown by indentation
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) == 1:
+            # Top level import, only the tree ending in main is the app's
+            if name.strip() != "main":
+                modules = []
+                continue
+            modules.append((name.strip(), int(self_us), int(cumulative_us)))
+            break
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    packages = {}
+    for name, self_us, _ in modules:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        "packages_ms": {name: us / 1000 for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        "repo_modules_ms": {name: {"self": self_us / 1000, "cumulative": cumulative_us / 1000}
+                            for name, self_us, cumulative_us in sorted(modules, key=lambda module: -module[2])
+                            if name.split(".")[0] in REPO_PACKAGES}
+    }
+
+def summarise(runs):
+    summary = {
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "startup_ms": statistics.median(run["startup_ms"] for run in runs),
+        "total_ms": statistics.median(run["total_ms"] for run in runs),
+        "total_max_ms": max(run["total_ms"] for run in runs),
+    }
+    for path in PATHS:
+        summary["first " + path + "_ms"] = statistics.median(run["responses_ms"][path] for run in runs)
+    return summary
+
+def main(arguments):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    upstreams = start_upstreams(latency=arguments.latency_ms / 1000)
+    configure_environment(upstreams, False)
+    try:
+        seed_race()
+        runs = [json.loads(run_harness().stdout.strip().splitlines()[-1]) for _ in range(arguments.runs)]
+        breakdown = import_breakdown(run_harness(("-X", "importtime")).stderr, arguments.top)
+    finally:
+        for upstream in upstreams.values():
+            upstream.stop()
+
+    summary = summarise(runs)
+    report = {
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(arguments),
+        "summary": summary,
+        "imports": breakdown,
+        "runs": runs,
+    }
+    output = Path(arguments.output) if arguments.output else RESULTS_DIR / "cold-start-{timestamp}.json".format(timestamp=datetime.utcnow().strftime("%Y%m%d-%H%M%S"))
+    output.write_text(json.dumps(report, indent=2))
+
+    print("{:<28} {:>10}".format("median of " + str(arguments.runs) + " runs", "ms"))
+    for name, value in summary.items():
+        print("{:<28} {:>10.1f}".format(name, value))
+    print("\n{:<28} {:>10}".format("package (self import time)", "ms"))
+    for name, value in breakdown["packages_ms"].items():
+        print("{:<28} {:>10.1f}".format(name, value))
+    print("\n{:<28} {:>10} {:>10}".format("repo module", "self ms", "cum ms"))
+    for name, value in breakdown["repo_modules_ms"].items():
+        print("{:<28} {:>10.1f} {:>10.1f}".format(name, value["self"], value["cumulative"]))
+    print("Saved " + str(output))
+
+    if arguments.budget_ms is not None and summary["total_ms"] > arguments.budget_ms:
+        print("Cold start {total:.1f}ms is over the {budget:.1f}ms budget".format(total=summary["total_ms"], budget=arguments.budget_ms))
+        sys.exit(1)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start of the app against local fake upstreams")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="added latency per upstream response")
+    parser.add_argument("--top", type=int, default=15, help="packages listed in the import breakdown")
+    parser.add_argument("--budget-ms", type=float, help="exit with an error when the median total is over this")
+    parser.add_argument("--output", help="path of the JSON report, defaults to benchmarks/results/")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    main(parse_arguments())
@@ -0,0 +1,353 @@
+# Local stand-ins for Ergast, Open-Meteo, the MongoDB Data API and the highlights channel search.
+# Each runs on its own port with a configurable response latency and records per-route timings.
+import csv
+import json
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+CIRCUITS = Path(__file__).parent.parent / "data" / "circuit_timezones.csv"
+TRACKS = Path(__file__).parent.parent / "data" / "tracks.csv"
+SEASON = 2022
+ROUNDS = 22
+DRIVERS = 20
+
+
+class RouteStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = defaultdict(list)
+
+    def record(self, route, seconds):
+        with self._lock:
+            self._timings[route].append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {route: list(timings) for route, timings in self._timings.items()}
+
+
+class FakeUpstream:
+    # Base for a fake upstream, subclasses implement handle(method, path, query, body) -> (status, payload, route)
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.stats = RouteStats()
+        self._server = None
+
+    @property
+    def uri(self):
+        host, port = self._server.server_address[:2]
+        return "http://{host}:{port}".format(host=host, port=port)
+
+    def start(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes, with Nagle on the body waits for the client's delayed ACK (~40ms)
+            disable_nagle_algorithm = True
+
+            def _serve(self, method):
+                start = time.perf_counter()
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length)) if length else None
+                parts = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                if upstream.latency:
+                    time.sleep(upstream.latency)
+                status, payload, route = upstream.handle(method, parts.path, query, body)
+                content = json.dumps(payload).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client cancelled the request, e.g. fetches dropped once a race is up to date
+                    self.close_connection = True
+                upstream.stats.record(route, time.perf_counter() - start)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _load_circuits():
+    with open(CIRCUITS, newline="") as file:
+        return [row for row in csv.DictReader(file)]
+
+def _driver(number):
+    return {
+        "driverId": "driver_{number}".format(number=number),
+        "code": "D{number:02d}".format(number=number),
+        "givenName": "Driver",
+        "familyName": "Number {number}".format(number=number)
+    }
+
+def _constructor(number):
+    return {"constructorId": "team_{number}".format(number=number // 2), "name": "Team {number}".format(number=number // 2)}
+
+
+class FakeErgast(FakeUpstream):
+    def __init__(self, latency=0.0, season=SEASON, rounds=ROUNDS, last_round=ROUNDS):
+        super().__init__(latency)
+        self.season = season
+        self.last_round = last_round
+        circuits = _load_circuits()
+        start = date(season, 3, 20)
+        self.schedule = []
+        for round in range(1, rounds + 1):
+            circuit = circuits[(round - 1) % len(circuits)]
+            self.schedule.append({
+                "season": str(season),
+                "round": str(round),
+                "raceName": "Round {round} Grand Prix".format(round=round),
+                "date": (start + timedelta(weeks=round - 1)).strftime("%Y-%m-%d"),
+                "time": "13:00:00Z",
+                "Circuit": {
+                    "circuitId": circuit["circuitId"],
+                    "circuitName": circuit["circuitId"].replace("_", " ").title() + " Circuit",
+                    "Location": {"lat": circuit["lat"], "long": circuit["long"], "locality": circuit["circuitId"], "country": "Country"}
+                }
+            })
+
+    def _results(self, round):
+        results = []
+        for position in range(1, DRIVERS + 1):
+            grid = (position + round) % DRIVERS + 1
+            entry = {
+                "position": str(position),
+                "points": str(max(0, 26 - position * 2) if position <= 10 else 0),
+                "grid": str(grid),
+                "status": "Finished" if position <= 15 else ("+1 Lap" if position <= 18 else "Engine"),
+                "Driver": _driver(position),
+                "Constructor": _constructor(position),
+                "FastestLap": {"rank": str(position), "Time": {"time": "1:3{digit}.123".format(digit=position % 10)}}
+            }
+            if position <= 15:
+                entry["Time"] = {"time": "+{position}.000".format(position=position)}
+            results.append(entry)
+        return results
+
+    def _race(self, round):
+        return dict(self.schedule[round - 1], Results=self._results(round))
+
+    def _driver_standings(self, round):
+        return [{
+            "position": str(position),
+            "points": str((DRIVERS - position) * round),
+            "Driver": _driver(position),
+            "Constructors": [_constructor(position)]
+        } for position in range(1, DRIVERS + 1)]
+
+    def _constructor_standings(self, round):
+        return [{
+            "position": str(position),
+            "points": str((DRIVERS - position) * round * 2),
+            "Constructor": _constructor(position * 2)
+        } for position in range(1, DRIVERS // 2 + 1)]
+
+    def _standings_response(self, key, round, standings):
+        return {"MRData": {"total": "1", "StandingsTable": {"StandingsLists": [
+            {"season": str(self.season), "round": str(round), key: standings}
+        ]}}}
+
+    def handle(self, method, path, query, body):
+        path = path.replace("/current/", "/{season}/".format(season=self.season))
+        if path.endswith("/last/results.json"):
+            race = self._race(self.last_round)
+            return 200, {"MRData": {"total": str(DRIVERS), "RaceTable": {"Races": [race]}}}, "ergast:last_results"
+        match = re.fullmatch(r"/(\d{4})(?:/(\d+))?/(driverStandings|constructorStandings)\.json", path)
+        if match:
+            round = int(match[2]) if match[2] else self.last_round
+            if match[3] == "driverStandings":
+                return 200, self._standings_response("DriverStandings", round, self._driver_standings(round)), "ergast:driver_standings"
+            return 200, self._standings_response("ConstructorStandings", round, self._constructor_standings(round)), "ergast:constructor_standings"
+        match = re.fullmatch(r"/(\d{4})/results\.json", path)
+        if match:
+            rows = [(round, entry) for round in range(1, self.last_round + 1) for entry in self._results(round)]
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 30))
+            races = []
+            for round, entry in rows[offset:offset + limit]:
+                if races and races[-1]["round"] == str(round):
+                    races[-1]["Results"].append(entry)
+                else:
+                    races.append(dict(self.schedule[round - 1], Results=[entry]))
+            return 200, {"MRData": {"total": str(len(rows)), "RaceTable": {"Races": races}}}, "ergast:season_results"
+        if path.endswith("/next.json"):
+            races = self.schedule[self.last_round:self.last_round + 1]
+            return 200, {"MRData": {"total": str(len(races)), "RaceTable": {"Races": races}}}, "ergast:next"
+        match = re.fullmatch(r"/(\d{4})/(\d+)\.json", path)
+        if match:
+            round = int(match[2])
+            races = [self.schedule[round - 1]] if round <= len(self.schedule) else []
+            return 200, {"MRData": {"total": str(len(races)), "RaceTable": {"Races": races}}}, "ergast:race"
+        match = re.fullmatch(r"/(\d{4})\.json", path)
+        if match:
+            return 200, {"MRData": {"total": str(len(self.schedule)), "RaceTable": {"Races": self.schedule}}}, "ergast:schedule"
+        return 404, {}, "ergast:not_found"
+
+
+class FakeOpenMeteo(FakeUpstream):
+    def _location(self, start_date, end_date):
+        days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+        return {"daily": {
+            "time": [(datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(days)],
+            "weathercode": [day % 4 for day in range(days)],
+            "temperature_2m_max": [25.0 + day % 5 for day in range(days)],
+            "temperature_2m_min": [15.0 + day % 5 for day in range(days)],
+            "precipitation_sum": [0.0 for day in range(days)]
+        }}
+
+    def handle(self, method, path, query, body):
+        route = "open_meteo:" + path.rsplit("/", 1)[-1]
+        locations = [self._location(query["start_date"], query["end_date"]) for _ in query["latitude"].split(",")]
+        return 200, locations if len(locations) > 1 else locations[0], route
+
+
+def _get_path(document, path):
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def _matches(document, filter):
+    for key, condition in filter.items():
+        if key == "$or":
+            if not any(_matches(document, option) for option in condition):
+                return False
+            continue
+        value = _get_path(document, key)
+        if isinstance(condition, dict) and "$oid" in condition:
+            condition = condition["$oid"]
+        if isinstance(condition, dict):
+            for operator, operand in condition.items():
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$gt" and (value is None or not value > operand):
+                    return False
+                if operator == "$gte" and (value is None or not value >= operand):
+                    return False
+                if operator == "$lt" and (value is None or not value < operand):
+                    return False
+                if operator == "$lte" and (value is None or not value <= operand):
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+def _set_path(document, path, value):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        if isinstance(document, list):
+            document = document[int(key)]
+        else:
+            document = document.setdefault(key, {})
+    if isinstance(document, list):
+        document[int(keys[-1])] = value
+    else:
+        document[keys[-1]] = value
+
+
+class FakeDataApi(FakeUpstream):
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.collections = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def insert(self, collection, document):
+        document = dict(document, _id=uuid.uuid4().hex[:24])
+        self.collections[collection].append(document)
+        return document["_id"]
+
+    def handle(self, method, path, query, body):
+        action = path.rsplit("/", 1)[-1]
+        route = "data_api:" + action
+        with self._lock:
+            documents = self.collections[body["collection"]]
+            if action == "find":
+                found = [document for document in documents if _matches(document, body.get("filter", {}))]
+                for key, direction in reversed(list(body.get("sort", {}).items())):
+                    found.sort(key=lambda document: _get_path(document, key), reverse=direction < 0)
+                if body.get("limit"):
+                    found = found[:body["limit"]]
+                return 200, {"documents": json.loads(json.dumps(found))}, route
+            if action == "insertOne":
+                return 201, {"insertedId": self.insert(body["collection"], body["document"])}, route
+            if action == "insertMany":
+                return 201, {"insertedIds": [self.insert(body["collection"], document) for document in body["documents"]]}, route
+            if action == "updateOne":
+                for document in documents:
+                    if _matches(document, body["filter"]):
+                        for path, value in body["update"].get("$set", {}).items():
+                            _set_path(document, path, value)
+                        return 200, {"matchedCount": 1, "modifiedCount": 1}, route
+                return 200, {"matchedCount": 0, "modifiedCount": 0}, route
+        return 404, {}, route
+
+
+class FakeChannelSearch(FakeUpstream):
+    # Mimics the dict result of youtubesearchpython ChannelSearch
+    def __init__(self, latency=0.0, season=SEASON, rounds=ROUNDS):
+        super().__init__(latency)
+        self.videos = [{
+            "id": "video{round:02d}".format(round=round),
+            "title": "Race Highlights | {season} Round {round} Grand Prix".format(season=season, round=round),
+            "published": "{hours} hours ago".format(hours=round),
+            "uri": "/watch?v=video{round:02d}".format(round=round)
+        } for round in range(rounds, 0, -1)]
+
+    def handle(self, method, path, query, body):
+        return 200, {"result": self.videos}, "channel_search:search"
+
+
+def seed_tracks(data_api):
+    # Stand-in for the tracks collection, the bundled rows with a map each
+    with open(TRACKS, newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            data_api.insert("tracks", {
+                "name": row["name"],
+                "mapUri": "https://example.com/tracks/{circuit_id}.png".format(circuit_id=row["circuitId"]),
+                "turns": int(row["turns"]),
+                "length": float(row["length"]),
+                "laps": int(row["laps"]),
+                "distance": float(row["distance"]),
+                "drsDetectionZones": int(row["drsDetectionZones"]),
+                "drsZones": int(row["drsZones"])
+            })
+
+def start_upstreams(latency=0.0):
+    data_api = FakeDataApi(latency).start()
+    seed_tracks(data_api)
+    return {
+        "ergast": FakeErgast(latency).start(),
+        "open_meteo": FakeOpenMeteo(latency).start(),
+        "data_api": data_api,
+        "channel_search": FakeChannelSearch(latency).start(),
+    }
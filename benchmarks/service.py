@@ -0,0 +1,203 @@
+# Drives /api/latest, /api/update and /api/update/highlights through the FastAPI app against local fake upstreams.
+# Run from the repository root:
+#   python -m benchmarks.service --latency-ms 50 --requests 500 --concurrency 8
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from .fake_upstreams import start_upstreams
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarise(latencies, elapsed):
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+def stage_timings(before, after):
+    # Upstream calls made during a scenario, by fake upstream route
+    stages = {}
+    for route, timings in after.items():
+        new_timings = timings[len(before.get(route, [])):]
+        if new_timings:
+            stages[route] = {
+                "calls": len(new_timings),
+                "mean_ms": statistics.mean(new_timings) * 1000,
+                "p99_ms": percentile(new_timings, 99) * 1000,
+            }
+    return stages
+
+def app_stage_timings(before, after):
+    # Pipeline stage spans recorded by the app during a scenario
+    stages = {}
+    for (stage,), series in after.items():
+        previous = before.get((stage,), {"count": 0, "sum": 0.0})
+        calls = series["count"] - previous["count"]
+        if calls:
+            stages[stage] = {"calls": calls, "mean_ms": (series["sum"] - previous["sum"]) / calls * 1000}
+    return stages
+
+def all_stats(upstreams):
+    stats = {}
+    for upstream in upstreams.values():
+        stats.update(upstream.stats.snapshot())
+    return stats
+
+
+class Benchmark:
+    def __init__(self, upstreams, client_factory, metrics):
+        self.upstreams = upstreams
+        self.client_factory = client_factory
+        self.metrics = metrics
+        self.results = {}
+
+    def run(self, name, path, iterations, concurrency=1, before_each=None, expected_status=200):
+        stats_before = all_stats(self.upstreams)
+        app_stages_before = self.metrics.stage_duration.snapshot()
+        latencies = []
+        lock = threading.Lock()
+        per_worker = [iterations // concurrency + (1 if worker < iterations % concurrency else 0) for worker in range(concurrency)]
+
+        def worker(count, client):
+            for _ in range(count):
+                if before_each is not None:
+                    before_each()
+                start = time.perf_counter()
+                response = client.get(path)
+                elapsed = time.perf_counter() - start
+                if response.status_code != expected_status:
+                    raise RuntimeError("{path} returned {status}: {body}".format(path=path, status=response.status_code, body=response.text[:200]))
+                with lock:
+                    latencies.append(elapsed)
+
+        start = time.perf_counter()
+        if concurrency == 1:
+            worker(iterations, self.client_factory(0))
+        else:
+            threads = [threading.Thread(target=worker, args=(count, self.client_factory(index))) for index, count in enumerate(per_worker)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        result = summarise(latencies, elapsed)
+        result["concurrency"] = concurrency
+        result["stages"] = stage_timings(stats_before, all_stats(self.upstreams))
+        result["app_stages"] = app_stage_timings(app_stages_before, self.metrics.stage_duration.snapshot())
+        self.results[name] = result
+        return result
+
+
+def configure_environment(upstreams, upstream_cache):
+    os.environ.update({
+        "ERGAST_API_URI": upstreams["ergast"].uri,
+        "OPEN_METEO_API_URI": upstreams["open_meteo"].uri,
+        "OPEN_METEO_ARCHIVE_API_URI": upstreams["open_meteo"].uri,
+        "YOUTUBE_SEARCH_URI": upstreams["channel_search"].uri + "/search",
+        "MONGODB_API_URI": upstreams["data_api"].uri,
+        "MONGODB_API_KEY": "benchmark",
+        "MONGODB_CLUSTER": "benchmark",
+        "DB_NAME": "benchmark",
+        "UPSTREAM_CACHE_MODE": "record" if upstream_cache else "off",
+        "UPSTREAM_CACHE_PATH": str(RESULTS_DIR / "upstream_cache.sqlite"),
+        # Fake races are in a past season, keep them eligible for the highlights search
+        "HIGHLIGHTS_WINDOW_HOURS": str(20 * 365 * 24),
+        # The fake Ergast has no rate limits, back to back iterations would otherwise time Ergast's quota
+        "ERGAST_REQUESTS_PER_SECOND": str(1000000),
+        "ERGAST_REQUESTS_PER_HOUR": str(1000000),
+    })
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(arguments):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    upstreams = start_upstreams(latency=arguments.latency_ms / 1000)
+    configure_environment(upstreams, arguments.upstream_cache)
+
+    # Environment has to be in place before the app reads its configuration
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+    from fastapi.testclient import TestClient
+    import main as app_module
+    from api import metrics, race_data
+
+    data_api = upstreams["data_api"]
+    with TestClient(app_module.app) as client:
+        # Latest route is sync, each worker thread gets its own client
+        worker_clients = {}
+
+        def client_factory(index):
+            if index == 0:
+                return client
+            return worker_clients.setdefault(index, TestClient(app_module.app))
+
+        benchmark = Benchmark(upstreams, client_factory, metrics)
+
+        def clear_races():
+            data_api.collections["races"].clear()
+            race_data.free_cache()
+
+        def clear_highlights():
+            for document in data_api.collections["races"]:
+                document["highlights"]["uri"] = ""
+
+        benchmark.run("update_ingest", "/api/update", arguments.iterations, before_each=clear_races)
+        benchmark.run("update_up_to_date", "/api/update", arguments.iterations)
+        benchmark.run("update_highlights", "/api/update/highlights", arguments.iterations, before_each=clear_highlights)
+        benchmark.run("latest_cold", "/api/latest", arguments.iterations, before_each=race_data.free_cache)
+        benchmark.run("latest_warm", "/api/latest", arguments.requests, concurrency=arguments.concurrency)
+
+    for upstream in upstreams.values():
+        upstream.stop()
+
+    report = {
+        "timestamp": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "config": vars(arguments),
+        "scenarios": benchmark.results,
+    }
+    output = Path(arguments.output) if arguments.output else RESULTS_DIR / "service-{timestamp}.json".format(timestamp=datetime.utcnow().strftime("%Y%m%d-%H%M%S"))
+    output.write_text(json.dumps(report, indent=2))
+
+    print("{:<20} {:>10} {:>10} {:>10} {:>10}".format("scenario", "req/s", "p50 ms", "p99 ms", "upstream"))
+    for name, result in benchmark.results.items():
+        upstream_calls = sum(stage["calls"] for stage in result["stages"].values()) / result["requests"]
+        print("{:<20} {:>10.1f} {:>10.2f} {:>10.2f} {:>10.1f}".format(name, result["throughput_rps"], result["p50_ms"], result["p99_ms"], upstream_calls))
+    print("Saved " + str(output))
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the service against local fake upstreams")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="added latency per upstream response")
+    parser.add_argument("--iterations", type=int, default=20, help="requests per update and cold scenario")
+    parser.add_argument("--requests", type=int, default=500, help="requests for the warm /api/latest scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads for the warm /api/latest scenario")
+    parser.add_argument("--upstream-cache", action="store_true", help="keep the upstream response cache enabled")
+    parser.add_argument("--output", help="path of the JSON report, defaults to benchmarks/results/")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    main(parse_arguments())
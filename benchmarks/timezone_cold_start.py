@@ -0,0 +1,42 @@
+# Compares cold-start cost of the circuit timezone index against loading tzwhere polygons.
+# Each case runs in a fresh interpreter, run from the repository root:
+#   python -m benchmarks.timezone_cold_start
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+CASES = {
+    "tzwhere": """
+from tzwhere import tzwhere
+tz = tzwhere.tzwhere()
+for lat, long in COORDINATES:
+    tz.tzNameAt(lat, long)
+""",
+    "circuit_index": """
+from api.timezones import find_timezone
+for lat, long in COORDINATES:
+    find_timezone(lat, long)
+""",
+}
+
+HARNESS = """
+import csv, json, resource, time
+start = time.perf_counter()
+COORDINATES = [(float(row["lat"]), float(row["long"])) for row in csv.DictReader(open("data/circuit_timezones.csv"))]
+{case}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}}))
+"""
+
+def run_case(code):
+    output = subprocess.run([sys.executable, "-W", "ignore", "-c", HARNESS.format(case=code)],
+                            cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    for name, code in CASES.items():
+        result = run_case(code)
+        print("{name:<15} {seconds:8.3f}s  {rss:8.1f} MB".format(name=name, seconds=result["seconds"], rss=result["max_rss_kb"] / 1024))
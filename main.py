@@ -1,22 +1,43 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import os
-from dotenv import load_dotenv
-load_dotenv()
 
 from routers import race_router
 
-from api import race_data
+from api import highlights, live, metrics, race_data, scheduler, tracks
+from api.database import mongodb_client
+from api.utils import data_source_client
 
 app = FastAPI()
 
 app.include_router(race_router.router)
 
+@app.on_event("startup")
+async def start_workers():
+    if tracks.TRACKS_REFRESH:
+        tracks.start_refresh()
+    live.start_broadcaster(race_data.get_latest_race_data)
+    # The scheduler hands newly stored races to the highlights worker, both run in one worker at a time
+    if highlights.HIGHLIGHTS_WORKER or scheduler.RACE_SCHEDULER:
+        scheduler.start_leader(scheduler.RACE_SCHEDULER)
+
+@app.on_event("shutdown")
+async def close_clients():
+    await scheduler.stop_leader()
+    await live.stop_broadcaster()
+    await data_source_client.aclose()
+    await mongodb_client.aclose()
+
 @app.get("/status")
 def server_status():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def server_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 origins = [
     '*',
     os.environ.get("FRONTEND_URI"),
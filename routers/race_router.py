@@ -1,23 +1,64 @@
 from datetime import date
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, WebSocket
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from schemas import race_classes
-from api import race_data
+from api import aggregates, backfill, export, highlights, live, race_data
+from api.responses import HISTORY_CACHE_CONTROL, payload_response
 
 router = APIRouter(prefix="/api")
 
-@router.get("/latest", response_model=race_classes.RaceData)
-def latest_race_data():
-    return race_data.get_latest_race_data()
+@router.get("/latest", responses={200: {"model": race_classes.RaceData}})
+def latest_race_data(request: Request):
+    return payload_response(race_data.get_latest_race_data(), request)
+
+@router.get("/latest/stream")
+async def latest_race_stream():
+    queue = await live.subscribe()
+    return StreamingResponse(live.event_stream(queue), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.websocket("/latest/ws")
+async def latest_race_websocket(websocket: WebSocket):
+    queue = await live.subscribe()
+    await websocket.accept()
+    await live.serve_websocket(websocket, queue)
+
+@router.get("/next/weather", responses={200: {"model": race_classes.NextRaceWeather}})
+def next_race_weather(request: Request):
+    return payload_response(race_data.get_next_race_weather(), request)
+
+@router.get("/races/{season}", responses={200: {"model": List[race_classes.RaceData]}})
+def season_race_data(season: int, request: Request):
+    return payload_response(race_data.get_season_race_data(season), request, cache_control=HISTORY_CACHE_CONTROL)
+
+@router.get("/races/{season}/{round}", responses={200: {"model": race_classes.RaceData}})
+def historical_race_data(season: int, round: int, request: Request):
+    return payload_response(race_data.get_race_data(season, round), request, cache_control=HISTORY_CACHE_CONTROL)
+
+@router.get("/drivers/{code}", responses={200: {"model": race_classes.DriverAggregate}})
+def driver_aggregate(code: str, request: Request):
+    return payload_response(aggregates.get_driver_aggregate(code), request)
+
+@router.get("/constructors/{name}", responses={200: {"model": race_classes.ConstructorAggregate}})
+def constructor_aggregate(name: str, request: Request):
+    return payload_response(aggregates.get_constructor_aggregate(name), request)
+
+@router.get("/export/races")
+def export_races(from_season: Optional[int] = None, to_season: Optional[int] = None):
+    return StreamingResponse(export.export_races(from_season, to_season), media_type="application/x-ndjson")
 
 @router.get("/update", status_code=200)
-def update_race_data():
-    return race_data.update_latest_race_data()
+async def update_race_data(refresh: bool = False):
+    return await race_data.update_latest_race_data(refresh=refresh)
+
+@router.get("/update/backfill/{season}", status_code=200)
+async def backfill_season_data(season: int):
+    return await backfill.backfill_season(season)
 
 @router.get("/update/highlights", status_code=200)
 def update_highlights_data():
-    return race_data.find_latest_highlights_yt()
+    return highlights.find_highlights()
 
 @router.get("/update/cache", status_code=200)
 def update_cache():
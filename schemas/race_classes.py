@@ -38,7 +38,7 @@ class ResultEntry(BaseModel):
     name: str
     driverCode: str
     time: str
-    points: int
+    points: float
     team: str
     teamLogoUri: str
     teamLogoAlt: str
@@ -52,7 +52,7 @@ class DriverStandingEntry(BaseModel):
     position: int
     name: str
     driverCode: str
-    points: int
+    points: float
     team: str
     teamLogoUri: str
     teamLogoAlt: str
@@ -60,7 +60,7 @@ class DriverStandingEntry(BaseModel):
 class ConstructorStandingEntry(BaseModel):
     position: int
     name: str
-    points: int
+    points: float
     teamLogoUri: str
     teamLogoAlt: str
 
@@ -71,6 +71,28 @@ class NextRace(BaseModel):
     raceDateTime: str
     dateTimeUtc: str
 
+class NextRaceWeather(BaseModel):
+    nextRace: NextRace
+    weather: Weather
+
+class SeasonAggregate(BaseModel):
+    season: int
+    races: int
+    points: float
+    pointsProgression: List[float]
+    averagePositionChange: float
+    fastestLaps: int
+    dnfs: int
+
+class DriverAggregate(BaseModel):
+    driverCode: str
+    name: str
+    seasons: List[SeasonAggregate]
+
+class ConstructorAggregate(BaseModel):
+    name: str
+    seasons: List[SeasonAggregate]
+
 class RaceData(BaseModel):
     race: RaceInfo
     track: Track